@@ -5,7 +5,7 @@ Download files from the ACL Anthology.
 
 Usage:
   acl_anthology.py -h
-  acl_anthology.py update
+  acl_anthology.py update [options]
   acl_anthology.py (match|fetch) <expr>... [options]
 
 Arguments:
@@ -15,42 +15,90 @@ Arguments:
 Options:
   -d, --destination DIR    Directory to save files to [default: {SCRIPTDIR}/pdf].
   -n, --dry-run            Don't download files.
+  --verify                 Verify the checksums of existing files against the
+                           download manifest, and download corrupt files again.
+  --revalidate             Ask the server whether existing files have changed,
+                           and download them again if so.
+  -j, --jobs NUM           Number of files to verify in parallel. [default: 4]
+  --sparse                 When fetching Anthology metadata for the first
+                           time, only fetch the latest version of data/xml.
   --debug                  Verbose log messages.
   -h, --help               Display this helpful text.
 """
 
+import csv
 from docopt import docopt
-import better_exceptions
 from glob import glob
+import hashlib
 import logging
 import logzero
 from logzero import logger as log
-from lxml import etree
 import os
+import pathlib
 import re
-import requests
 import time
-from tqdm import tqdm
 
 
 ACL_REPO = "https://github.com/acl-org/acl-anthology"
 ANTHOLOGY_URL = "https://aclanthology.org/{}.pdf"
 SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
 
+# collection letters of old-style IDs -> venue
+VENUES = {
+    "D": "EMNLP",
+    "E": "EACL",
+    "J": "CL",
+    "N": "NAACL",
+    "K": "CoNLL",
+    "P": "ACL",
+    "Q": "TACL",
+}
+# venue identifiers of new-style IDs (e.g. 2020.acl-main.699) -> venue
+NEW_VENUES = {venue.lower(): venue for venue in VENUES.values()}
 
-def update_acl_repo(repo_dir, force=False):
+
+def update_acl_repo(repo_dir, force=False, sparse=False, url=ACL_REPO, since=None):
+    """
+    Clones or updates the Anthology repository in repo_dir.  Returns the list
+    of collection XML files that changed (or all of them after cloning), so
+    that anything derived from them only needs to be rebuilt for those files.
+
+    By default, these are the files changed by this update.  Callers that keep
+    derived data across runs should pass the commit it was built from as
+    `since` instead, as the repository may also have been updated by another
+    script in the meantime.
+
+    With sparse=True, a new clone only contains the most recent commit and
+    only checks out data/xml; subsequent updates also fetch only the most
+    recent commit.  `url` can also be a local path (e.g. for testing), which
+    is passed to git as a file:// URL, as git ignores --depth and --filter
+    for plain paths.
+    """
     from datetime import datetime, timedelta
     from git import Repo
 
     repo_token = os.path.join(repo_dir, ".pulled")
+    if os.path.exists(url):
+        url = pathlib.Path(url).resolve().as_uri()
 
     if not os.path.exists(repo_dir):
         os.mkdir(repo_dir)
         log.info("Fetching Anthology metadata...")
-        repo = Repo.clone_from(ACL_REPO, repo_dir, branch="master")
+        if sparse:
+            repo = Repo.clone_from(
+                url,
+                repo_dir,
+                branch="master",
+                depth=1,
+                filter="blob:none",
+                sparse=True,
+            )
+            repo.git.sparse_checkout("set", "data/xml")
+        else:
+            repo = Repo.clone_from(url, repo_dir, branch="master")
         with open(repo_token, "a"):
             os.utime(repo_token, None)
-        delta = timedelta(hours=0)
+        return sorted(glob(f"{repo_dir}/data/xml/*.xml"))
     elif os.path.exists(repo_token):
         delta = datetime.now() - datetime.fromtimestamp(os.path.getmtime(repo_token))
         log.debug(
@@ -62,13 +110,45 @@ def update_acl_repo(repo_dir, force=False):
         delta = timedelta.max
 
     repo = Repo(repo_dir)
+    changed = None
     if force or delta > timedelta(hours=24):
         log.info("Checking Anthology metadata for updates...")
-        repo.remotes.origin.pull()
+        old_commit = repo.head.commit.hexsha
+        if os.path.exists(os.path.join(repo.git_dir, "shallow")):
+            repo.remotes.origin.fetch("master", depth=1)
+            repo.git.reset("--hard", "FETCH_HEAD")
+        else:
+            repo.remotes.origin.pull()
+        changed = changed_xml_files(repo, repo_dir, old_commit)
+        for filename in changed:
+            log.debug(f"Changed: {filename}")
+        log.info(
+            f"{len(changed)} collection {'file' if len(changed)==1 else 'files'} changed."
+        )
         with open(repo_token, "a"):
             os.utime(repo_token, None)
     else:
         log.info("Anthology metadata is up-to-date.")
+    if since is not None:
+        return changed_xml_files(repo, repo_dir, since)
+    return changed or []
+
+
+def changed_xml_files(repo, repo_dir, old_commit):
+    """
+    Returns the collection XML files changed between old_commit and HEAD, or
+    all of them if old_commit isn't available (e.g. in a shallow clone).
+    """
+    from git import GitCommandError
+
+    try:
+        changed = repo.git.diff(
+            "--name-only", old_commit, "HEAD", "--", "data/xml/*.xml"
+        ).split()
+    except GitCommandError:
+        log.debug(f"Commit {old_commit} not available; considering all files")
+        return sorted(glob(f"{repo_dir}/data/xml/*.xml"))
+    return [os.path.join(repo_dir, filename) for filename in changed]
 
 
 def build_anthology_id(collection_id, volume_id, paper_id=None):
@@ -96,7 +176,32 @@ def build_anthology_id(collection_id, volume_id, paper_id=None):
     return anthology_id
 
 
+def venue_of(anthology_id):
+    """
+    Returns the venue of an Anthology ID, e.g. 'ACL' for both P18-1001 and
+    2020.acl-main.699.  IDs of other venues return their collection letter
+    (old-style IDs) or venue identifier (new-style IDs), e.g. 'W' or 'findings'.
+    """
+    if anthology_id[:1].isdigit() and "." in anthology_id:
+        venue = anthology_id.split(".")[1].split("-")[0]
+        return NEW_VENUES.get(venue, venue)
+    return VENUES.get(anthology_id[0], anthology_id[0])
+
+
+def year_of(anthology_id):
+    """
+    Returns the year of an Anthology ID as a string, e.g. '2018' for P18-1001
+    or '2020' for 2020.acl-main.699.
+    """
+    if anthology_id[:1].isdigit() and "." in anthology_id:
+        return anthology_id.split(".")[0]
+    yearstr = anthology_id[1:3]
+    return f"20{yearstr}" if int(yearstr) < 50 else f"19{yearstr}"
+
+
 def match_ids(ids):
+    from lxml import etree
+
     map_to_prefix = lambda x: x[: x.find("*") + 1] if "*" in x[:3] else x[:3]
     map_to_regex = lambda x: x.replace("?", ".").replace("*", ".+")
 
@@ -136,74 +241,288 @@ def match_ids(ids):
     return matched
 
 
-def check_ids(ids, destdir, force=False):
-    checked = []
+def iter_paper_metadata(xmlfile):
+    """
+    Yields (full_id, year, authors, title) for every paper in an Anthology
+    collection XML file, where authors is a list of (first, last) tuples.
+    """
+    from lxml import etree
+
+    prefix, _ = os.path.splitext(os.path.basename(xmlfile))
+    tree = etree.parse(xmlfile)
+    for volume in tree.getroot().findall(".//volume"):
+        volume_id = volume.get("id")
+        year = volume.findtext("./meta/year")
+        for paper in volume.findall(".//paper"):
+            title = paper.find("title")
+            if title is None:
+                continue
+            full_id = build_anthology_id(prefix, volume_id, paper.get("id"))
+            authors = [
+                (author.findtext("first") or "", author.findtext("last") or "")
+                for author in paper.findall("author")
+            ]
+            yield full_id, year, authors, "".join(title.itertext())
+
+
+MANIFEST_FIELDS = ("id", "size", "sha256", "etag", "last_modified", "corrupt")
+
+
+def read_manifest(filename):
+    """
+    Reads the download manifest, mapping Anthology IDs to dicts with the size,
+    SHA-256 checksum, ETag and Last-Modified header of the downloaded file, and
+    whether the local file was found to be corrupt and not yet replaced.
+    """
+    manifest = {}
+    if not os.path.exists(filename):
+        return manifest
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+        for row in reader:
+            record = dict(zip(MANIFEST_FIELDS, row))
+            record["size"] = int(record["size"])
+            record["corrupt"] = record.get("corrupt") == "1"
+            manifest[record.pop("id")] = record
+    return manifest
+
+
+def write_manifest(filename, manifest):
+    # write to a temporary file first, so an interrupted run can't leave a
+    # truncated manifest behind
+    with open(f"{filename}.tmp", "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        for full_id, record in sorted(manifest.items()):
+            writer.writerow(
+                [full_id]
+                + [record[k] for k in MANIFEST_FIELDS[1:-1]]
+                + ["1" if record.get("corrupt") else ""]
+            )
+    os.replace(f"{filename}.tmp", filename)
+
+
+def file_sha256(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def looks_like_pdf(filename):
+    # truncated downloads lack the end-of-file marker
+    with open(filename, "rb") as f:
+        if f.read(5) != b"%PDF-":
+            return False
+        f.seek(max(0, os.path.getsize(filename) - 1024))
+        return b"%%EOF" in f.read()
+
+
+def verify_file(local_file, record):
+    """
+    Checks a local file against its manifest record.  Files without a record
+    only need to look like a complete PDF file.  Returns (ok, record), where
+    record is a new record for files that didn't have one.
+    """
+    if record is not None:
+        ok = (
+            os.path.getsize(local_file) == record["size"]
+            and file_sha256(local_file) == record["sha256"]
+        )
+        # a file marked as corrupt may have been replaced by hand since
+        return ok, dict(record, corrupt=False) if ok else record
+    if not looks_like_pdf(local_file):
+        return False, None
+    record = {
+        "size": os.path.getsize(local_file),
+        "sha256": file_sha256(local_file),
+        "etag": "",
+        "last_modified": "",
+        "corrupt": False,
+    }
+    return True, record
+
+
+def check_ids(
+    ids, destdir, force=False, manifest=None, verify=False, revalidate=False, jobs=4
+):
+    """
+    Returns the (full_id, url, local_file) entries that need to be downloaded.
+
+    Existing files are skipped, unless their size doesn't match the manifest
+    or, with verify=True, their checksum doesn't match it (or, if they're not
+    in the manifest, they don't look like a complete PDF file).  Corrupt files
+    stay marked as such in the manifest until download_ids() replaces them, so
+    they are downloaded again even if this download fails.  With
+    revalidate=True, intact files are also returned, so that download_ids()
+    can ask the server whether they changed.
+    """
+    checked, existing = [], []
     for full_id, url in ids:
         local_file = f"{destdir}/{full_id[:3]}/{full_id}.pdf"
         if not force and os.path.exists(local_file):
+            existing.append((full_id, url, local_file))
             continue
         if not os.path.exists(os.path.dirname(local_file)):
             os.makedirs(os.path.dirname(local_file))
         checked.append((full_id, url, local_file))
 
+    if manifest is not None and existing:
+        records = [manifest.get(full_id) for full_id, _, _ in existing]
+        if verify:
+            from concurrent.futures import ThreadPoolExecutor
+
+            log.info(f"Verifying {len(existing)} existing files...")
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(
+                    executor.map(verify_file, [e[2] for e in existing], records)
+                )
+        else:
+            results = [
+                (
+                    record is None
+                    or (
+                        not record["corrupt"]
+                        and os.path.getsize(local_file) == record["size"]
+                    ),
+                    record,
+                )
+                for (_, _, local_file), record in zip(existing, records)
+            ]
+        for entry, (ok, record) in zip(existing, results):
+            full_id = entry[0]
+            if not ok:
+                log.warning(f"{full_id}: local file is corrupt; downloading again")
+                if record is None:
+                    record = {
+                        "size": os.path.getsize(entry[2]),
+                        "sha256": "",
+                        "etag": "",
+                        "last_modified": "",
+                    }
+                manifest[full_id] = dict(record, corrupt=True)
+                checked.append(entry)
+                continue
+            if record is not None:
+                manifest[full_id] = record
+            if revalidate:
+                checked.append(entry)
+
     if len(checked) < len(ids):
         log.info(f"Skipping download of {len(ids) - len(checked)} files.")
 
     return checked
 
 
-def download_ids(ids):
-    log.info(f"Downloading {len(entries)} {'file' if len(entries)==1 else 'files'}...")
-    progress = tqdm(total=len(entries), unit="files")
-    for i, (full_id, url, local_file) in enumerate(entries):
-        progress.set_description_str(f"{full_id} ")
-        for _ in range(5):
-            try:
-                h = requests.head(url, allow_redirects=True)
-            except Exception as e:
-                progress.write(f"{full_id}: HEAD caused exception '{str(e)}'")
-                time.sleep(5)
-                continue
-            content_type = h.headers.get("content-type")
-            if "pdf" not in content_type.lower():
-                progress.write(f"{url} is not a PDF file (got: {content_type})")
-                break
-            else:
+def download_ids(ids, manifest=None, manifest_file=None):
+    """
+    Downloads files, recording their size, checksum and caching headers in
+    the manifest.  Files that are already in the manifest are only
+    transferred again if the server reports that they have changed.
+    """
+    import requests
+    from tqdm import tqdm
+
+    log.info(f"Downloading {len(ids)} {'file' if len(ids)==1 else 'files'}...")
+    progress = tqdm(total=len(ids), unit="files")
+    unchanged = 0
+    try:
+        for i, (full_id, url, local_file) in enumerate(ids):
+            progress.set_description_str(f"{full_id} ")
+            headers = {}
+            record = manifest.get(full_id) if manifest is not None else None
+            # corrupt files must be transferred again even if unchanged
+            if (
+                record is not None
+                and not record["corrupt"]
+                and os.path.exists(local_file)
+            ):
+                if record["etag"]:
+                    headers["If-None-Match"] = record["etag"]
+                if record["last_modified"]:
+                    headers["If-Modified-Since"] = record["last_modified"]
+            for _ in range(5):
                 try:
-                    r = requests.get(url, allow_redirects=True)
+                    r = requests.get(url, headers=headers, allow_redirects=True)
                 except Exception as e:
                     progress.write(f"{full_id}: GET caused exception '{str(e)}'")
                     time.sleep(5)
                     continue
-                if r.status_code == requests.codes.ok:
-                    with open(local_file, "wb") as f:
-                        f.write(r.content)
+                if r.status_code == requests.codes.not_modified:
+                    unchanged += 1
                     break
-                else:
+                if r.status_code != requests.codes.ok:
                     progress.write(f"{full_id}: received HTTP status {r.status_code}")
-        else:
-            progress.write(f"{full_id}: giving up")
-        progress.update()
-        # if (i+1) % 50 == 0:
-        #    tqdm.write(f"Downloaded {i+1:4d} files -- pausing for 10 seconds")
-        #    time.sleep(10)
-    progress.close()
+                    continue
+                content_type = r.headers.get("content-type", "")
+                if "pdf" not in content_type.lower():
+                    progress.write(f"{url} is not a PDF file (got: {content_type})")
+                    break
+                # write to a temporary file first, so an interrupted download
+                # can't leave a truncated PDF file behind
+                with open(f"{local_file}.part", "wb") as f:
+                    f.write(r.content)
+                os.replace(f"{local_file}.part", local_file)
+                if manifest is not None:
+                    manifest[full_id] = {
+                        "size": len(r.content),
+                        "sha256": hashlib.sha256(r.content).hexdigest(),
+                        "etag": r.headers.get("etag", ""),
+                        "last_modified": r.headers.get("last-modified", ""),
+                        "corrupt": False,
+                    }
+                break
+            else:
+                progress.write(f"{full_id}: giving up")
+            progress.update()
+            if manifest_file is not None and (i + 1) % 50 == 0:
+                write_manifest(manifest_file, manifest)
+            # if (i+1) % 50 == 0:
+            #    tqdm.write(f"Downloaded {i+1:4d} files -- pausing for 10 seconds")
+            #    time.sleep(10)
+    finally:
+        progress.close()
+        if manifest_file is not None:
+            write_manifest(manifest_file, manifest)
+    if unchanged:
+        log.info(f"{unchanged} {'file' if unchanged==1 else 'files'} unchanged.")
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
     logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
 
-    update_acl_repo(f"{SCRIPTDIR}/.anthology-repo", force=args["update"])
+    update_acl_repo(
+        f"{SCRIPTDIR}/.anthology-repo", force=args["update"], sparse=args["--sparse"]
+    )
     if args["match"] or args["fetch"]:
         entries = match_ids(args["<expr>"])
     if args["fetch"]:
         destdir = args["--destination"]
         if "{SCRIPTDIR}" in destdir:
             destdir = destdir.replace("{SCRIPTDIR}", SCRIPTDIR)
-        entries = check_ids(entries, destdir)
+        manifest_file = f"{destdir}/manifest.tsv"
+        manifest = read_manifest(manifest_file)
+        entries = check_ids(
+            entries,
+            destdir,
+            manifest=manifest,
+            verify=args["--verify"],
+            revalidate=args["--revalidate"],
+            jobs=int(args["--jobs"]),
+        )
         if entries and not args["--dry-run"]:
-            download_ids(entries)
+            download_ids(entries, manifest, manifest_file)
+        elif not args["--dry-run"] and os.path.exists(destdir):
+            write_manifest(manifest_file, manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+Single entry point for the scripts in this directory.
+
+Only the module implementing the given command is imported, so commands don't
+pay for the dependencies of other commands.  Use `acl_citations.py <command>
+-h` to get help for a specific command.
+
+Usage:
+  acl_citations.py -h
+  acl_citations.py <command> [<args>...]
+
+Commands:
+  update      Update the Anthology metadata (acl_anthology.py update).
+  fetch       Download PDFs from the Anthology (acl_anthology.py fetch).
+  grobid      Extract references with a GROBID server (grobid_client.py).
+  parse       Extract years of cited papers (parse_tei.py).
+  find        Extract authors/titles of cited papers (find_cited_papers.py).
+  match       Fuzzy-match cited papers (match_cited_papers.py).
+  compare     Compare two clusterings of cited papers (compare_clusters.py).
+  diff        Diff two files with citation years (cite_diff.py).
+  summarize   Summarize the pipeline logs (summarize_logs.py).
+  counts      Count Anthology papers per year (get_paper_counts.py).
+  resolve     Resolve matched papers to Anthology IDs (resolve_citations.py).
+  cube        Aggregated citation counts (citation_cube.py).
+  cocite      Co-citation and coupling neighbors (cocitation.py).
+  query       Query the citation dataset (query_citations.py).
+  bootstrap   Bootstrap citation age statistics (bootstrap_ages.py).
+  sample      Estimate citation age statistics from a sample (sample_ages.py).
+  shard       Run the ParsCit pipeline in shards (shard_pipeline.py).
+
+Options:
+  -h, --help                Display this helpful text.
+"""
+
+from docopt import docopt
+import importlib
+import os
+import sys
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+# command -> (module, arguments to prepend)
+COMMANDS = {
+    "update": ("acl_anthology", ["update"]),
+    "fetch": ("acl_anthology", ["fetch"]),
+    "grobid": ("grobid_client", []),
+    "parse": ("parse_tei", []),
+    "find": ("find_cited_papers", []),
+    "match": ("match_cited_papers", []),
+    "compare": ("compare_clusters", []),
+    "diff": ("cite_diff", []),
+    "summarize": ("summarize_logs", []),
+    "counts": ("get_paper_counts", []),
+    "resolve": ("resolve_citations", []),
+    "cube": ("citation_cube", []),
+    "cocite": ("cocitation", []),
+    "query": ("query_citations", []),
+    "bootstrap": ("bootstrap_ages", []),
+    "sample": ("sample_ages", []),
+    "shard": ("shard_pipeline", []),
+}
+
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv, options_first=True)
+
+    command = args["<command>"]
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}\n", file=sys.stderr)
+        print(__doc__.strip(), file=sys.stderr)
+        exit(1)
+
+    module_name, prefix = COMMANDS[command]
+    if SCRIPTDIR not in sys.path:
+        sys.path.insert(0, SCRIPTDIR)
+    module = importlib.import_module(module_name)
+    module.main(prefix + args["<args>"])
+
+
+if __name__ == "__main__":
+    main()
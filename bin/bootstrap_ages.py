@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+Bootstrap confidence intervals for citation age statistics per year (and venue).
+
+Papers, not individual citations, are resampled, as citations from the same
+paper are not independent of each other.
+
+Usage:
+  bootstrap_ages.py -h
+  bootstrap_ages.py <csvfile> --csv <outfile> [options]
+
+Arguments:
+  <csvfile>                 File produced by parse_tei.py (e.g. acl-parscit.tsv).
+
+Options:
+  --csv <outfile>           File to write the statistics to.
+  -b, --replicates NUM      Number of bootstrap replicates. [default: 2000]
+  -c, --confidence NUM      Confidence level in percent. [default: 95]
+  -o, --older-than NUM      Also compute the percentage of citations that are
+                            older than this many years. [default: 10]
+  --max-age NUM             Ignore citations older than this. [default: 50]
+  --by-venue                Compute statistics per year and venue.
+  --seed NUM                Seed for the random number generator.
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import defaultdict
+from docopt import docopt
+import csv
+import logging
+import logzero
+from logzero import logger as log
+import numpy as np
+import os
+
+from acl_anthology import venue_of
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def read_age_histograms(filename, max_age=50, by_venue=False):
+    """
+    Reads a file produced by parse_tei.py and returns a dict mapping each group
+    (year, or (year, venue)) to a matrix with one row per paper, where cell
+    (i, a) counts the citations of age a in paper i.
+    """
+    groups = defaultdict(list)
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+        for row in reader:
+            paper_id, year = row[0], int(row[1])
+            citations = row[2].split(",") if len(row) > 2 else []
+            if len(citations) <= 1:
+                # Front matter or articles that otherwise failed to parse any citations
+                continue
+            ages = year - np.array(citations, dtype=int)
+            ages = ages[(ages >= 0) & (ages <= max_age)]
+            if not len(ages):
+                continue
+            key = (year, venue_of(paper_id)) if by_venue else year
+            groups[key].append(np.bincount(ages, minlength=max_age + 1))
+    return {key: np.vstack(hists) for key, hists in groups.items()}
+
+
+def age_statistics(hists, older_than=10):
+    """
+    Computes statistics from age histograms, one per row of hists.  Returns a
+    dict mapping statistic names to arrays with one value per row.
+    """
+    ages = np.arange(hists.shape[1])
+    total = hists.sum(axis=1)
+    cumsum = hists.cumsum(axis=1)
+
+    def nth_smallest(n):
+        # age of the n-th smallest citation (zero-based) in each row
+        return (cumsum > n[:, None]).argmax(axis=1)
+
+    return {
+        "mean": hists @ ages / total,
+        "median": (nth_smallest((total - 1) // 2) + nth_smallest(total // 2)) / 2,
+        f"pct_older_than_{older_than}": (
+            100 * hists[:, older_than + 1 :].sum(axis=1) / total
+        ),
+    }
+
+
+def bootstrap(hists, replicates, rng, older_than=10, batch_size=500):
+    """
+    Resamples the papers (rows of hists) with replacement and returns the
+    statistics for every bootstrap replicate.
+    """
+    n = hists.shape[0]
+    results = defaultdict(list)
+    for start in range(0, replicates, batch_size):
+        size = min(batch_size, replicates - start)
+        # how often each paper is drawn in each replicate
+        weights = rng.multinomial(n, np.full(n, 1.0 / n), size=size)
+        for name, values in age_statistics(weights @ hists, older_than).items():
+            results[name].append(values)
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    older_than = int(args["--older-than"])
+    replicates = int(args["--replicates"])
+    alpha = (100 - float(args["--confidence"])) / 2
+    rng = np.random.default_rng(int(args["--seed"]) if args["--seed"] else None)
+
+    groups = read_age_histograms(
+        args["<csvfile>"], max_age=int(args["--max-age"]), by_venue=args["--by-venue"]
+    )
+    log.info(f"Bootstrapping {len(groups)} groups with {replicates} replicates each.")
+
+    with open(args["--csv"], "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        header = ["year", "venue"] if args["--by-venue"] else ["year"]
+        writer.writerow(header + ["papers", "statistic", "estimate", "lower", "upper"])
+        for key in sorted(groups):
+            hists = groups[key]
+            estimates = age_statistics(hists.sum(axis=0, keepdims=True), older_than)
+            samples = bootstrap(hists, replicates, rng, older_than)
+            for name, estimate in estimates.items():
+                lower, upper = np.percentile(samples[name], [alpha, 100 - alpha])
+                writer.writerow(
+                    (list(key) if args["--by-venue"] else [key])
+                    + [len(hists), name]
+                    + [f"{x:.4f}" for x in (estimate[0], lower, upper)]
+                )
+
+
+if __name__ == "__main__":
+    main()
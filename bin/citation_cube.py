@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""
+Maintain aggregated citation counts by venue, publication year and citation age.
+
+The cube is built from files produced by parse_tei.py and can be updated when
+new papers are added; papers that are already part of the cube are skipped.
+All normalized counts used in the analysis can be derived from the cube
+without going back to the individual citations.
+
+Like the analysis notebook, which filters out citations older than 50 years
+before normalizing, `counts` and `summary` ignore citations older than the
+given maximum age, also in the totals that counts are normalized by.  The
+results therefore only match the notebook with the default of 50; use a
+larger value to keep all citations (on acl-parscit.tsv, 2,548 citations are
+older than 50 years).  Papers are counted as long as they have any
+citations, even if all of them are older than the maximum age.
+
+Usage:
+  citation_cube.py -h
+  citation_cube.py update <cubefile> <csvfile>... [options]
+  citation_cube.py counts <cubefile> [options]
+  citation_cube.py summary <cubefile> [options]
+
+Arguments:
+  <cubefile>                File to store the cube in.  The list of papers it
+                            contains is stored next to it (*.papers).
+  <csvfile>                 File produced by parse_tei.py.
+
+Options:
+  --by-venue                Show counts/statistics per year and venue.
+  --min-age NUM             Only consider citations of at least this age
+                            when computing counts. [default: 0]
+  --max-age NUM             Ignore citations older than this, as in the
+                            notebook. [default: 50]
+  --agg-max NUM             Aggregate all citations of at least this age.
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import Counter, defaultdict
+from docopt import docopt
+import csv
+import logging
+import logzero
+from logzero import logger as log
+import os
+import sys
+
+from acl_anthology import venue_of
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+class CitationCube:
+    """
+    Citation counts by (venue, year, cited age), plus the venue, year and
+    number of counted citations of every paper that has been added.
+    """
+
+    def __init__(self):
+        self.cells = Counter()  # (venue, year, cited_age) -> count
+        self.papers = {}  # paper ID -> (venue, year, no. of citations)
+
+    def add_paper(self, paper_id, year, citations):
+        """
+        Adds the citation years of a paper; returns False if the paper was
+        already part of the cube.
+        """
+        if paper_id in self.papers:
+            return False
+        venue = venue_of(paper_id)
+        if len(citations) <= 1:
+            # Front matter or articles that otherwise failed to parse any citations
+            self.papers[paper_id] = (venue, year, 0)
+            return True
+        ages = [year - int(x) for x in citations if int(x) <= year]
+        for age in ages:
+            self.cells[(venue, year, age)] += 1
+        self.papers[paper_id] = (venue, year, len(ages))
+        return True
+
+    def add_csv(self, filename):
+        added, skipped = 0, 0
+        with open(filename, "r", newline="") as csvfile:
+            reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+            for row in reader:
+                citations = row[2].split(",") if len(row) > 2 and row[2] else []
+                if self.add_paper(row[0], int(row[1]), citations):
+                    added += 1
+                else:
+                    skipped += 1
+        return added, skipped
+
+    def save(self, filename):
+        # write both files under temporary names first and only then replace
+        # the old ones, so an interrupted run can't leave cells behind whose
+        # papers aren't listed (and would be counted again by the next update)
+        with open(f"{filename}.tmp", "w", newline="") as csvfile:
+            writer = csv.writer(
+                csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+            )
+            for (venue, year, age), count in sorted(self.cells.items()):
+                writer.writerow([venue, year, age, count])
+        with open(f"{filename}.papers.tmp", "w", newline="") as csvfile:
+            writer = csv.writer(
+                csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+            )
+            for paper_id, (venue, year, count) in sorted(self.papers.items()):
+                writer.writerow([paper_id, venue, year, count])
+        os.replace(f"{filename}.papers.tmp", f"{filename}.papers")
+        os.replace(f"{filename}.tmp", filename)
+
+    @classmethod
+    def load(cls, filename):
+        cube = cls()
+        if not os.path.exists(filename):
+            return cube
+        with open(filename, "r", newline="") as csvfile:
+            reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+            for venue, year, age, count in reader:
+                cube.cells[(venue, int(year), int(age))] = int(count)
+        with open(f"{filename}.papers", "r", newline="") as csvfile:
+            reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+            for paper_id, venue, year, count in reader:
+                cube.papers[paper_id] = (venue, int(year), int(count))
+        return cube
+
+    def is_consistent(self):
+        # every counted citation is in exactly one cell
+        return sum(self.cells.values()) == sum(n for _, _, n in self.papers.values())
+
+    def counts(self, by_venue=False, max_age=50, agg_max=None):
+        """
+        Returns a dict mapping (year, cited_age) -- or (year, venue, cited_age)
+        if by_venue is True -- to the number of citations.  Citations older
+        than max_age are ignored; with agg_max, citations of that age or older
+        are counted as agg_max.
+        """
+        counts = Counter()
+        for (venue, year, age), count in self.cells.items():
+            if age > max_age:
+                continue
+            if agg_max is not None:
+                age = min(age, agg_max)
+            counts[(year, venue, age) if by_venue else (year, age)] += count
+        return counts
+
+    def paper_counts(self, by_venue=False):
+        """
+        Returns a dict mapping year -- or (year, venue) -- to the number of
+        papers with citations.
+        """
+        counts = Counter()
+        for venue, year, num_citations in self.papers.values():
+            if num_citations:
+                counts[(year, venue) if by_venue else year] += 1
+        return counts
+
+
+def normalized_counts(cube, by_venue=False, min_age=0, max_age=50, agg_max=None):
+    """
+    Yields (group, cited_age, count, percent of all citations in the group,
+    citations per paper in the group, percent of citations of this age or
+    older, citations per paper of this age or older) for every group (year, or
+    (year, venue)) and cited age.
+    """
+    counts = cube.counts(by_venue=by_venue, max_age=max_age, agg_max=agg_max)
+    papers = cube.paper_counts(by_venue=by_venue)
+    by_group = defaultdict(dict)
+    for (*group, age), count in counts.items():
+        by_group[tuple(group) if by_venue else group[0]][age] = count
+    for group in sorted(by_group):
+        ages = by_group[group]
+        total = sum(ages.values())
+        cumulative = 0
+        rows = []
+        for age in sorted(ages, reverse=True):
+            cumulative += ages[age]
+            if age >= min_age:
+                rows.append(
+                    (group, age, ages[age])
+                    + (100 * ages[age] / total, ages[age] / papers[group])
+                    + (100 * cumulative / total, cumulative / papers[group])
+                )
+        yield from reversed(rows)
+
+
+def weighted_quantiles(ages, quantiles):
+    """
+    Computes quantiles from a dict mapping ages to counts, using the same
+    (linear) interpolation as pandas/NumPy.
+    """
+    values = sorted(ages)
+    total = sum(ages.values())
+    result = []
+    for q in quantiles:
+        position = q * (total - 1)
+        lower, upper = int(position), min(int(position) + 1, total - 1)
+        result.append(
+            nth_value(values, ages, lower) * (1 - (position - lower))
+            + nth_value(values, ages, upper) * (position - lower)
+        )
+    return result
+
+
+def nth_value(values, ages, n):
+    # value at (zero-based) position n of the sorted, expanded histogram
+    seen = 0
+    for value in values:
+        seen += ages[value]
+        if n < seen:
+            return value
+    return values[-1]
+
+
+def summary(cube, by_venue=False, max_age=50):
+    """
+    Yields (group, no. of citations, mean, quantiles) for every group, where
+    quantiles are the letter values shown in the boxen plots.
+    """
+    quantiles = (0.0625, 0.125, 0.25, 0.5, 0.75, 0.875, 0.9375)
+    counts = cube.counts(by_venue=by_venue, max_age=max_age)
+    by_group = defaultdict(dict)
+    for (*group, age), count in counts.items():
+        by_group[tuple(group) if by_venue else group[0]][age] = count
+    for group in sorted(by_group):
+        ages = by_group[group]
+        total = sum(ages.values())
+        mean = sum(age * count for age, count in ages.items()) / total
+        yield group, total, mean, weighted_quantiles(ages, quantiles)
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    cube = CitationCube.load(args["<cubefile>"])
+    if not cube.is_consistent():
+        log.error(
+            f"{args['<cubefile>']} doesn't match {args['<cubefile>']}.papers; "
+            "was an update interrupted?  Please rebuild the cube."
+        )
+        exit(1)
+    by_venue = args["--by-venue"]
+    max_age = int(args["--max-age"])
+    group_header = ["year", "venue"] if by_venue else ["year"]
+
+    def group_columns(group):
+        return list(group) if by_venue else [group]
+
+    if args["update"]:
+        for filename in args["<csvfile>"]:
+            added, skipped = cube.add_csv(filename)
+            log.info(f"{filename}: added {added} papers, skipped {skipped} known ones")
+        cube.save(args["<cubefile>"])
+        log.info(
+            f"Cube now has {len(cube.cells)} cells from {len(cube.papers)} papers."
+        )
+
+    elif args["counts"]:
+        writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+        writer.writerow(
+            group_header
+            + ["cited_age", "count", "percent_of_citations", "per_paper"]
+            + ["cumpercent", "cumcount"]
+        )
+        for group, age, *values in normalized_counts(
+            cube,
+            by_venue=by_venue,
+            min_age=int(args["--min-age"]),
+            max_age=max_age,
+            agg_max=int(args["--agg-max"]) if args["--agg-max"] else None,
+        ):
+            writer.writerow(
+                group_columns(group)
+                + [age, values[0]]
+                + [f"{x:.4f}" for x in values[1:]]
+            )
+
+    elif args["summary"]:
+        writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+        writer.writerow(
+            group_header
+            + ["count", "mean", "q6.25", "q12.5", "q25", "median", "q75"]
+            + ["q87.5", "q93.75"]
+        )
+        for group, total, mean, quantiles in summary(cube, by_venue, max_age):
+            writer.writerow(
+                group_columns(group)
+                + [total, f"{mean:.4f}"]
+                + [f"{q:g}" for q in quantiles]
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,6 @@ Options:
 """
 
 from docopt import docopt
-import better_exceptions
 import csv
 import logging
 import logzero
@@ -38,8 +37,10 @@ def parse_csv(filename):
     return data
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
@@ -69,3 +70,7 @@ if __name__ == "__main__":
         a_list = ",".join(a_list) if a_list else "--"
         b_list = ",".join(b_list) if b_list else "--"
         print(f"{key}\t{a_list}\t{b_list}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+Compute co-citation and bibliographic coupling neighbors from papers matched by
+match_cited_papers.py.
+
+Two cited papers are co-cited when the same ACL paper cites both of them; two
+ACL papers are bibliographically coupled when they cite the same paper.
+
+Usage:
+  cocitation.py -h
+  cocitation.py (cocitation|coupling) <csvfile> --csv <outfile> [options]
+
+Arguments:
+  <csvfile>                 File produced by match_cited_papers.py.
+
+Options:
+  --csv <outfile>           File to write the neighbor lists to.
+  -k, --top NUM             Number of neighbors to keep per paper. [default: 10]
+  -m, --min-count NUM       Minimum number of shared citations. [default: 1]
+  -c, --chunk-size NUM      Number of rows to multiply at a time. [default: 2000]
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from docopt import docopt
+import csv
+import logging
+import logzero
+from logzero import logger as log
+import numpy as np
+import os
+from scipy import sparse
+from tqdm import tqdm
+
+from match_cited_papers import read_matched
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def build_incidence_matrix(data):
+    """
+    Builds a binary CSR matrix with one row per citing paper and one column per
+    matched (cited) paper.  Returns (matrix, citing_ids, cited_ids).
+    """
+    citing_ids, cited_ids = {}, []
+    rows, cols = [], []
+    for col, (cluster_id, *_, citing_papers) in enumerate(data):
+        cited_ids.append(cluster_id)
+        for citing in citing_papers.split(","):
+            rows.append(citing_ids.setdefault(citing, len(citing_ids)))
+            cols.append(col)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(len(citing_ids), len(cited_ids)),
+    )
+    # a paper citing the same reference twice should only count once
+    matrix.data[:] = 1
+    return matrix, list(citing_ids), cited_ids
+
+
+def top_k_neighbors(matrix, k=10, min_count=1, chunk_size=2000):
+    """
+    Yields (row, neighbor, count) for the k largest off-diagonal entries of
+    matrix @ matrix.T in every row, computing only chunk_size rows at a time.
+    """
+    transposed = matrix.T.tocsr()
+    n = matrix.shape[0]
+    for start in tqdm(range(0, n, chunk_size), unit="chunks"):
+        end = min(start + chunk_size, n)
+        product = (matrix[start:end] @ transposed).tocsr()
+        for i in range(end - start):
+            lo, hi = product.indptr[i], product.indptr[i + 1]
+            counts, neighbors = product.data[lo:hi], product.indices[lo:hi]
+            keep = (counts >= min_count) & (neighbors != start + i)
+            counts, neighbors = counts[keep], neighbors[keep]
+            # sort by count, then by neighbor index for stable output
+            for j in np.lexsort((neighbors, -counts))[:k]:
+                yield start + i, neighbors[j], counts[j]
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    incidence, citing_ids, cited_ids = build_incidence_matrix(
+        read_matched(args["<csvfile>"])
+    )
+    log.info(
+        f"Loaded {incidence.nnz} citations of {len(cited_ids)} papers "
+        f"by {len(citing_ids)} papers."
+    )
+
+    if args["cocitation"]:
+        matrix, ids = incidence.T.tocsr(), cited_ids
+    else:
+        matrix, ids = incidence, citing_ids
+
+    with open(args["--csv"], "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        for row, neighbor, count in top_k_neighbors(
+            matrix,
+            k=int(args["--top"]),
+            min_count=int(args["--min-count"]),
+            chunk_size=int(args["--chunk-size"]),
+        ):
+            writer.writerow([ids[row], ids[neighbor], count])
+
+
+if __name__ == "__main__":
+    main()
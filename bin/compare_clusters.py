@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+Compare two clusterings of cited papers, e.g. from match_cited_papers.py with
+different settings.
+
+The clusterings are read from the files written with `match_cited_papers.py
+--members`, which contain the cluster of every row of the input file, so both
+must have been produced from the same input.  Pairs of citations that are in
+the same cluster in <members_b> are compared against those in <members_a>,
+which is treated as the reference.
+
+Usage:
+  compare_clusters.py -h
+  compare_clusters.py <members_a> <members_b> [<matched_a> <matched_b>] [options]
+
+Arguments:
+  <members_a>               Reference clustering (match_cited_papers.py -m).
+  <members_b>               Clustering to evaluate.
+  <matched_a>, <matched_b>  Output of match_cited_papers.py belonging to the
+                            clusterings; used to show titles of clusters.
+
+Options:
+  -n, --top NUM             Number of divergent clusters to show. [default: 10]
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import Counter, defaultdict
+from docopt import docopt
+import csv
+import logging
+import logzero
+from logzero import logger as log
+from math import comb
+import os
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def read_members(filename):
+    """
+    Reads a file written with `match_cited_papers.py --members`; returns a
+    dict mapping row numbers to cluster IDs.
+    """
+    members = {}
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quoting=csv.QUOTE_NONE)
+        next(reader, None)
+        for row, _, cluster in reader:
+            members[int(row)] = cluster
+    return members
+
+
+def contingency_table(members_a, members_b):
+    """
+    Counts how many rows are in each pair of clusters (a, b), considering only
+    rows that are part of both clusterings.
+    """
+    table = Counter()
+    for row, cluster_a in members_a.items():
+        cluster_b = members_b.get(row)
+        if cluster_b is not None:
+            table[(cluster_a, cluster_b)] += 1
+    return table
+
+
+def pair_counts(table):
+    """
+    Returns the number of pairs in the same cluster in both clusterings, in
+    clustering A, in clustering B, and the total number of pairs.
+    """
+    sizes_a, sizes_b = Counter(), Counter()
+    for (cluster_a, cluster_b), count in table.items():
+        sizes_a[cluster_a] += count
+        sizes_b[cluster_b] += count
+    both = sum(comb(count, 2) for count in table.values())
+    pairs_a = sum(comb(size, 2) for size in sizes_a.values())
+    pairs_b = sum(comb(size, 2) for size in sizes_b.values())
+    return both, pairs_a, pairs_b, comb(sum(sizes_a.values()), 2)
+
+
+def compare(table):
+    """
+    Returns pairwise precision and recall of clustering B with respect to
+    clustering A, and the adjusted Rand index.
+    """
+    both, pairs_a, pairs_b, total = pair_counts(table)
+    precision = both / pairs_b if pairs_b else 1.0
+    recall = both / pairs_a if pairs_a else 1.0
+    expected = pairs_a * pairs_b / total if total else 0.0
+    maximum = (pairs_a + pairs_b) / 2
+    if maximum == expected:
+        ari = 1.0
+    else:
+        ari = (both - expected) / (maximum - expected)
+    return precision, recall, ari
+
+
+def divergent_clusters(table, n=10, split=True):
+    """
+    Returns the n clusters of A that are split up the most in B (or, with
+    split=False, the n clusters of B that merge the most clusters of A), as
+    (cluster, size, rows outside of the largest overlapping cluster, dict of
+    overlapping clusters -> number of rows).
+    """
+    overlaps = defaultdict(dict)
+    for (cluster_a, cluster_b), count in table.items():
+        if split:
+            overlaps[cluster_a][cluster_b] = count
+        else:
+            overlaps[cluster_b][cluster_a] = count
+    divergent = []
+    for cluster, parts in overlaps.items():
+        if len(parts) < 2:
+            continue
+        size = sum(parts.values())
+        divergent.append((cluster, size, size - max(parts.values()), parts))
+    divergent.sort(key=lambda x: (-x[2], -x[1], x[0]))
+    return divergent[:n]
+
+
+def read_titles(filename):
+    from match_cited_papers import read_matched
+
+    return {row[0]: row[4] for row in read_matched(filename)}
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    members_a = read_members(args["<members_a>"])
+    members_b = read_members(args["<members_b>"])
+    if members_a.keys() != members_b.keys():
+        log.warning(
+            f"Clusterings cover different rows ({len(members_a)} vs. {len(members_b)}); "
+            f"only comparing the {len(members_a.keys() & members_b.keys())} common ones"
+        )
+    table = contingency_table(members_a, members_b)
+
+    titles_a, titles_b = {}, {}
+    if args["<matched_a>"]:
+        titles_a = read_titles(args["<matched_a>"])
+        titles_b = read_titles(args["<matched_b>"])
+
+    clusters_a = len({a for a, _ in table})
+    clusters_b = len({b for _, b in table})
+    precision, recall, ari = compare(table)
+    print(f"Rows:                {sum(table.values())}")
+    print(f"Clusters:            {clusters_a} (A)  {clusters_b} (B)")
+    print(f"Pairwise precision:  {precision:.4f}")
+    print(f"Pairwise recall:     {recall:.4f}")
+    print(f"Adjusted Rand index: {ari:.4f}")
+
+    top = int(args["--top"])
+    for split, heading, own, other in (
+        (True, "Clusters of A split up in B", titles_a, titles_b),
+        (False, "Clusters of B merging clusters of A", titles_b, titles_a),
+    ):
+        divergent = divergent_clusters(table, top, split=split)
+        if not divergent:
+            continue
+        print(f"\n{heading}:")
+        for cluster, size, outside, parts in divergent:
+            print(f"  {cluster}  ({size} rows, {outside} outside the largest part)")
+            if cluster in own:
+                print(f"      {own[cluster]}")
+            for part, count in sorted(parts.items(), key=lambda x: (-x[1], x[0])):
+                title = f"  {other[part]}" if part in other else ""
+                print(f"    {count:6d}  {part}{title}")
+
+
+if __name__ == "__main__":
+    main()
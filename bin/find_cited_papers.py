@@ -8,10 +8,19 @@ Usage:
   find_cited_papers.py <dir>... --csv <csvfile> [options]
 
 Arguments:
-  <dir>                     Directory/ies with TEI files to be parsed.
+  <dir>                     Directory/ies with TEI files to be parsed; can also
+                            be .tar(.gz/.bz2/.xz) or .zip archives, which are
+                            read without extracting them.
 
 Options:
   --csv <csvfile>           File to write citation data to.
+  -s, --sample FRACTION     Only parse a random sample of this fraction of
+                            files, stratified by venue and year.  The number
+                            of files per stratum is written to
+                            <csvfile>.strata.tsv (see sample_ages.py).
+  --seed NUM                Seed for drawing the sample.
+  -j, --jobs NUM            Number of directories/archives to process in
+                            parallel. [default: 1]
   --log <logfile>           Write log output to this file.
   -a, --age <range>         Only consider citations in the given age range,
                             where <range> is of the form "<min>-<max>".
@@ -20,27 +29,28 @@ Options:
 """
 
 from docopt import docopt
-import better_exceptions
 import csv
-from glob import glob
 import logging
 import logzero
 from logzero import logger as log
-from lxml import etree
 import os
 
+from parse_tei import file_id_of, is_archive, iter_xml_files, list_xml_files
+
 
 SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
 
 
-def parse_parscit(filename, min_year, max_year):
+def parse_parscit(filename, min_year, max_year, name=None):
+    from lxml import etree
+
     try:
         tree = etree.parse(filename)
     except Exception as e:
         log.exception(e)
         return [], 0
 
-    base = os.path.basename(filename)
+    base = os.path.basename(name or filename)
     output = []
 
     for c, bibitem in enumerate(
@@ -81,8 +91,29 @@ def infer_publication_year(file_id):
         return f"19{yearstr}"
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def find_in_path(path, min_age=0, max_age=9999, selected=None):
+    """
+    Parses all XML files in a directory or archive, returning a dict that maps
+    each file ID to the cited papers found in it.
+    """
+    log.info(f"Processing {path}")
+    output = {}
+    for name, source in iter_xml_files(path):
+        file_id = file_id_of(name)
+        if selected is not None and file_id not in selected:
+            continue
+        log.debug(f"Parsing {os.path.basename(name)}")
+        pub_year = int(infer_publication_year(file_id))
+        minimum_year = pub_year - max_age
+        maximum_year = pub_year - min_age
+        output[file_id] = parse_parscit(source, minimum_year, maximum_year, name)
+    return output
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
@@ -102,21 +133,45 @@ if __name__ == "__main__":
         min_age = int(min_age) if min_age else 0
         max_age = int(max_age) if max_age else 9999
 
+    selected = None
+    if args["--sample"]:
+        from sample_ages import stratified_sample, strata_filename, write_strata
+
+        file_ids = [
+            file_id_of(filename)
+            for dirname in args["<dir>"]
+            if os.path.exists(dirname)
+            for filename in list_xml_files(dirname)
+        ]
+        selected, strata = stratified_sample(
+            file_ids,
+            float(args["--sample"]),
+            seed=int(args["--seed"]) if args["--seed"] else None,
+        )
+        write_strata(strata_filename(args["--csv"]), strata)
+        log.info(f"Sampled {len(selected)} of {len(file_ids)} files.")
+
+    paths = []
     for dirname in args["<dir>"]:
-        log.info(f"Processing {dirname}")
-        if not os.path.exists(dirname):
+        if not os.path.isdir(dirname) and not is_archive(dirname):
             log.error(f"Directory not found: {dirname}")
             continue
-        for filename in glob(f"{dirname}/*.xml"):
-            base = os.path.basename(filename)
-            file_id = base.split(".")[0]
-            if file_id.endswith("-parscit"):
-                file_id = file_id[:-8]
-            log.debug(f"Parsing {base}")
-            pub_year = int(infer_publication_year(file_id))
-            minimum_year = pub_year - max_age
-            maximum_year = pub_year - min_age
-            output[file_id] = parse_parscit(filename, minimum_year, maximum_year)
+        paths.append(dirname)
+
+    jobs = min(int(args["--jobs"]), len(paths))
+    if jobs > 1:
+        from functools import partial
+        from multiprocessing import Pool
+
+        with Pool(jobs) as pool:
+            find = partial(
+                find_in_path, min_age=min_age, max_age=max_age, selected=selected
+            )
+            for path_output in pool.map(find, paths):
+                output.update(path_output)
+    else:
+        for path in paths:
+            output.update(find_in_path(path, min_age, max_age, selected))
 
     with open(args["--csv"], "w", newline="") as csvfile:
         writer = csv.writer(
@@ -125,3 +180,7 @@ if __name__ == "__main__":
         for file_id, rows in output.items():
             for row in rows:
                 writer.writerow([file_id] + row)
+
+
+if __name__ == "__main__":
+    main()
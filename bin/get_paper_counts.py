@@ -13,7 +13,6 @@ Options:
 """
 
 from docopt import docopt
-import better_exceptions
 import csv
 import logging
 import logzero
@@ -26,8 +25,10 @@ from acl_anthology import update_acl_repo, match_ids
 SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
@@ -48,3 +49,7 @@ if __name__ == "__main__":
         )
         for year, count in counts.items():
             writer.writerow([year, count])
+
+
+if __name__ == "__main__":
+    main()
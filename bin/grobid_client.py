@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+Extract references from PDF files with a GROBID server.
+
+The TEI output for each PDF file is saved next to it (as *.tei.xml), so that
+the directories can be passed to parse_tei.py with `--format grobid`.
+
+Usage:
+  grobid_client.py -h
+  grobid_client.py <dir>... [options]
+
+Arguments:
+  <dir>                     Directory/ies with PDF files to be processed.
+
+Options:
+  -s, --server URL          URL of the GROBID server. [default: http://localhost:8070]
+  -n, --concurrency NUM     Maximum number of concurrent requests. [default: 10]
+  --retries NUM             Number of times to retry a failed request. [default: 5]
+  --timeout SEC             Timeout for a single request. [default: 120]
+  --consolidate             Ask GROBID to consolidate citations (slow).
+  --force                   Process files even if TEI output already exists.
+  --log <logfile>           Write log output to this file.
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import Counter
+from docopt import docopt
+from glob import glob
+import logging
+import logzero
+from logzero import logger as log
+import os
+import threading
+import time
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+ENDPOINT = "/api/processReferences"
+
+# GROBID answers with 503 when all of its workers are busy
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+local = threading.local()
+
+
+def tei_filename(pdf):
+    return f"{pdf[:-4] if pdf.endswith('.pdf') else pdf}.tei.xml"
+
+
+def get_session():
+    import requests
+
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    return local.session
+
+
+def process_pdf(pdf, url, retries=5, timeout=120, consolidate=False):
+    """
+    Sends a PDF file to GROBID and writes the resulting TEI file.  Returns a
+    status string: 'ok', 'empty', or 'failed'.
+    """
+    base = os.path.basename(pdf)
+    data = {"consolidateCitations": "1" if consolidate else "0"}
+    for attempt in range(retries + 1):
+        if attempt:
+            # exponential backoff, so that a busy server can catch up
+            time.sleep(min(2**attempt, 60))
+        try:
+            with open(pdf, "rb") as f:
+                r = get_session().post(
+                    url, files={"input": (base, f)}, data=data, timeout=timeout
+                )
+        except Exception as e:
+            log.warning(f"{base}: request caused exception '{str(e)}'")
+            continue
+        if r.status_code == 200:
+            # write to a temporary file first, so an interrupted run can't
+            # leave a truncated TEI file behind (which would be skipped later)
+            with open(f"{tei_filename(pdf)}.part", "wb") as f:
+                f.write(r.content)
+            os.replace(f"{tei_filename(pdf)}.part", tei_filename(pdf))
+            return "ok"
+        if r.status_code == 204:
+            log.warning(f"{base}: GROBID could not extract any references")
+            return "empty"
+        if r.status_code not in RETRY_STATUS:
+            log.error(f"{base}: received HTTP status {r.status_code}")
+            return "failed"
+        log.debug(f"{base}: received HTTP status {r.status_code}; retrying")
+    log.error(f"{base}: giving up after {retries + 1} attempts")
+    return "failed"
+
+
+def process_pdfs(pdfs, url, concurrency=10, **kwargs):
+    """
+    Processes PDF files with at most `concurrency` requests in flight at any
+    time; new files are only submitted once a previous request has finished.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from tqdm import tqdm
+
+    stats = Counter()
+    progress = tqdm(total=len(pdfs), unit="files")
+    pending = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for pdf in pdfs:
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stats[future.result()] += 1
+                    progress.update()
+            pending.add(executor.submit(process_pdf, pdf, url, **kwargs))
+        for future in pending:
+            stats[future.result()] += 1
+            progress.update()
+    progress.close()
+    return stats
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    if args["--log"]:
+        logzero.logfile(
+            args["--log"],
+            encoding="utf-8",
+            formatter=logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S", color=False),
+        )
+
+    pdfs = []
+    for dirname in args["<dir>"]:
+        if not os.path.exists(dirname):
+            log.error(f"Directory not found: {dirname}")
+            continue
+        for pdf in sorted(glob(f"{dirname}/*.pdf")):
+            if args["--force"] or not os.path.exists(tei_filename(pdf)):
+                pdfs.append(pdf)
+    log.info(f"Processing {len(pdfs)} {'file' if len(pdfs)==1 else 'files'}...")
+
+    stats = process_pdfs(
+        pdfs,
+        args["--server"].rstrip("/") + ENDPOINT,
+        concurrency=int(args["--concurrency"]),
+        retries=int(args["--retries"]),
+        timeout=int(args["--timeout"]),
+        consolidate=args["--consolidate"],
+    )
+    for status, count in sorted(stats.items()):
+        log.info(f"{status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,24 +13,31 @@ Arguments:
 Options:
   -j, --join-across-years   Join matching papers from subsequent years.
   -r, --ratio NUM           Maximum allowed score for fuzzy matching. [default: 95]
+  -u, --union-find          Compare all candidate pairs and merge matching ones
+                            with union-find, instead of comparing each entry to
+                            the first entry of existing clusters.  The result
+                            does not depend on the order of the input.
+  -p, --processes NUM       Number of processes to score candidate pairs with
+                            when using --union-find. [default: 1]
+  -m, --members FILE        Also write the cluster ID of every row of <csvfile>
+                            to this file (see compare_clusters.py).
   --debug                   Verbose log messages.
   -h, --help                Display this helpful text.
 """
 
 from collections import defaultdict, Counter
 from docopt import docopt
-import better_exceptions
 import csv
+from functools import lru_cache
 from fuzzywuzzy import fuzz
+from itertools import combinations, islice
 import logging
 import logzero
 from logzero import logger as log
 from slugify import slugify
 import string
-from tqdm import tqdm
 import os
 
-
 global FUZZRATIO
 FUZZRATIO = 95
 SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
@@ -38,6 +45,10 @@ SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
 global counters
 counters = Counter()
 
+# Without python-Levenshtein, fuzz.ratio falls back to difflib, which is slow
+# enough that it pays off to rule out matches by counting characters first
+COUNT_FILTERS = fuzz.SequenceMatcher.__module__ == "difflib"
+
 
 def parse_author_string(s):
     authors = []
@@ -51,6 +62,61 @@ def authors_to_str(authors):
     return ", ".join(" ".join(author) for author in authors)
 
 
+@lru_cache(maxsize=200000)
+def char_counts(s):
+    return Counter(s)
+
+
+@lru_cache(maxsize=200000)
+def bigram_counts(s):
+    return Counter(zip(s, s[1:]))
+
+
+def below_ratio(matches, total):
+    # 100 * 2 * matches / total < FUZZRATIO + 0.5
+    return 400 * matches < (2 * FUZZRATIO + 1) * total
+
+
+def fuzzy_match(a, b):
+    """
+    Returns fuzz.ratio(a, b) > FUZZRATIO, but first tries to rule out a match
+    with cheap upper bounds on the ratio.
+
+    fuzz.ratio is 2*M / (len(a) + len(b)), where M is the length of a common
+    subsequence of a and b.  M can't exceed the length of the shorter string,
+    nor the number of characters a and b have in common.  Also, the M matched
+    characters form at most (len(a) + len(b) - 2*M + 1) contiguous blocks, and
+    all adjacent characters within a block are bigrams shared by a and b, so M
+    can't exceed (shared bigrams + len(a) + len(b) + 1) / 3.
+
+    A match is only ruled out if the bound is below FUZZRATIO + 0.5, which is
+    checked with integers: the ratio is computed with floats and rounded to
+    the nearest integer (with ties going to the even one), so a bound at or
+    above that could still be rounded up to more than FUZZRATIO.  Therefore,
+    the result is always the same as that of fuzz.ratio.
+
+    Only the length bound is cheaper to compute than fuzz.ratio with
+    python-Levenshtein; the others are only used with COUNT_FILTERS.
+    """
+    total = len(a) + len(b)
+    if below_ratio(min(len(a), len(b)), total):
+        counters["fuzzy-skipped-length"] += 1
+        return False
+    if not COUNT_FILTERS:
+        counters["fuzzy-ratio-calls"] += 1
+        return fuzz.ratio(a, b) > FUZZRATIO
+    common = sum((char_counts(a) & char_counts(b)).values())
+    if below_ratio(common, total):
+        counters["fuzzy-skipped-chars"] += 1
+        return False
+    shared = sum((bigram_counts(a) & bigram_counts(b)).values())
+    if below_ratio((shared + total + 1) // 3, total):
+        counters["fuzzy-skipped-bigrams"] += 1
+        return False
+    counters["fuzzy-ratio-calls"] += 1
+    return fuzz.ratio(a, b) > FUZZRATIO
+
+
 def check_authors(a_list, b_list):
     if a_list == b_list:
         return True
@@ -60,7 +126,7 @@ def check_authors(a_list, b_list):
     lower_first = lambda l: tuple(x[0].lower() for x in l)
     lower_last = lambda l: tuple(x[1].lower() for x in l)
     for a_last, b_last in zip(lower_last(a_list), lower_last(b_list)):
-        if a_last != b_last and fuzz.ratio(a_last, b_last) <= FUZZRATIO:
+        if a_last != b_last and not fuzzy_match(a_last, b_last):
             return False
     for a_first, b_first in zip(lower_first(a_list), lower_first(b_list)):
         if not a_first or not b_first:
@@ -68,7 +134,7 @@ def check_authors(a_list, b_list):
         if (
             a_first != b_first
             and a_first[0] != b_first[0]
-            and fuzz.ratio(a_first, b_first) <= FUZZRATIO
+            and not fuzzy_match(a_first, b_first)
         ):
             return False
     counters["authors-matched"] += 1
@@ -92,7 +158,7 @@ def check_title(a_title, b_title):
     # titles are already lower-cased
     if a_title == b_title:
         return True
-    if fuzz.ratio(a_title, b_title) > FUZZRATIO:
+    if fuzzy_match(a_title, b_title):
         counters["title-matched"] += 1
         # log.debug(f'fuzzy-matched titles "{a_title}" and "{b_title}"')
         return True
@@ -133,6 +199,106 @@ def match_within_year(data, progress):
     return by_id
 
 
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        # the smaller index always becomes the root, so the result doesn't
+        # depend on the order of union operations
+        if x < y:
+            self.parent[y] = x
+        elif y < x:
+            self.parent[x] = y
+
+
+def candidate_pairs(keys):
+    # check_authors requires the same number of authors, so only entries with
+    # the same number of authors are candidates
+    by_num_authors = defaultdict(list)
+    for i, (authors, _) in enumerate(keys):
+        by_num_authors[len(authors)].append(i)
+    for indices in by_num_authors.values():
+        yield from combinations(indices, 2)
+
+
+def init_worker(keys, ratio):
+    global FUZZRATIO, worker_keys
+    FUZZRATIO, worker_keys = ratio, keys
+
+
+def score_pairs(pairs, keys=None):
+    keys = worker_keys if keys is None else keys
+    matched = []
+    for i, j in pairs:
+        (a_authors, a_title), (b_authors, b_title) = keys[i], keys[j]
+        if check_authors(a_authors, b_authors) and check_title(a_title, b_title):
+            matched.append((i, j))
+    return matched
+
+
+def score_pairs_in_worker(pairs):
+    # counters of worker processes are passed back to the main process
+    counters.clear()
+    return score_pairs(pairs), Counter(counters)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def match_within_year_unionfind(data, progress, processes=1, batch_size=10000):
+    # identical (authors, title) combinations are always in the same cluster,
+    # so only distinct ones need to be compared
+    rows_by_key = defaultdict(list)
+    for row in data:
+        acl_id, _, author_string, title = row
+        authors = parse_author_string(author_string)
+        title = clean_title(title)
+        row.extend([authors, title])
+        rows_by_key[(tuple(authors), title)].append(row)
+    keys = sorted(rows_by_key)
+
+    union_find = UnionFind(len(keys))
+    batches = batched(candidate_pairs(keys), batch_size)
+    if processes > 1:
+        from multiprocessing import Pool
+
+        with Pool(
+            processes, initializer=init_worker, initargs=(keys, FUZZRATIO)
+        ) as pool:
+            for matched, worker_counters in pool.imap_unordered(
+                score_pairs_in_worker, batches
+            ):
+                counters.update(worker_counters)
+                for i, j in matched:
+                    union_find.union(i, j)
+    else:
+        for batch in batches:
+            for i, j in score_pairs(batch, keys):
+                union_find.union(i, j)
+
+    clusters = defaultdict(list)
+    for i, key in enumerate(keys):
+        rows = sorted(rows_by_key[key], key=lambda row: row[:4])
+        clusters[union_find.find(i)].extend(rows)
+    progress.update(len(data))
+
+    # clusters are numbered in order of their smallest key
+    return {n: clusters[root] for n, root in enumerate(sorted(clusters), start=1)}
+
+
 def match_across_years(year_a, year_b):
     # find papers with identical authors+titles published in adjacent years, as
     # this often happens when there's an arXiv paper in year Y and a
@@ -156,7 +322,9 @@ def match_across_years(year_a, year_b):
     return merged
 
 
-def match_data(data):
+def match_data(data, union_find=False, processes=1):
+    from tqdm import tqdm
+
     # gather by year, then match within year
     data_by_year = defaultdict(list)
     for row in data:
@@ -164,15 +332,39 @@ def match_data(data):
 
     by_year_id = {}
     progress = tqdm(total=len(data))
-    for year, rows in data_by_year.items():
-        by_year_id[year] = match_within_year(rows, progress)
+    if union_find:
+        for year in sorted(data_by_year):
+            by_year_id[year] = match_within_year_unionfind(
+                data_by_year[year], progress, processes
+            )
+    else:
+        for year, rows in data_by_year.items():
+            by_year_id[year] = match_within_year(rows, progress)
     progress.close()
 
     return by_year_id
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def read_matched(filename):
+    """
+    Reads a file produced by this script, returning a list of rows with the
+    columns (id, num_cited, year, authors, title, citing_papers).
+    """
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quoting=csv.QUOTE_NONE)
+        header = next(reader, None)
+        if header is not None and header[0] != "id":
+            # file without header line
+            return [header] + [row for row in reader]
+        return [row for row in reader]
+
+
+def main(argv=None):
+    import better_exceptions
+    from tqdm import tqdm
+
+    global FUZZRATIO
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
@@ -184,8 +376,12 @@ if __name__ == "__main__":
 
     FUZZRATIO = int(args["--ratio"])
     min_match = 1
+    # rows are extended, but never copied, during matching
+    row_numbers = {id(row): i for i, row in enumerate(data)}
 
-    matched = match_data(data)
+    matched = match_data(
+        data, union_find=args["--union-find"], processes=int(args["--processes"])
+    )
 
     if args["--join-across-years"]:
         all_years = sorted(list(matched.keys()))
@@ -201,6 +397,7 @@ if __name__ == "__main__":
                 del matched[year_b][id_b]
 
     output = []
+    members = []
 
     for name, count in counters.items():
         log.info(f"Counter({name}) = {count}")
@@ -221,8 +418,21 @@ if __name__ == "__main__":
                 ",".join(e[0] for e in entries),
             ]
             output.append(row)
+            members.extend((row_numbers[id(e)], e[0], row[0]) for e in entries)
+
+    if args["--members"]:
+        with open(args["--members"], "w", newline="") as csvfile:
+            writer = csv.writer(
+                csvfile, delimiter="\t", quoting=csv.QUOTE_NONE, lineterminator="\n"
+            )
+            writer.writerow(("row", "citing_paper", "id"))
+            writer.writerows(sorted(members))
 
     header = ("id", "num_cited", "year", "authors", "title", "citing_papers")
     print("\t".join(header))
     for row in output:
         print("\t".join(row))
+
+
+if __name__ == "__main__":
+    main()
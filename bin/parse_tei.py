@@ -8,33 +8,45 @@ Usage:
   parse_tei.py <dir>... --csv <csvfile> [options]
 
 Arguments:
-  <dir>                     Directory/ies with TEI files to be parsed.
+  <dir>                     Directory/ies with TEI files to be parsed; can also
+                            be .tar(.gz/.bz2/.xz) or .zip archives, which are
+                            read without extracting them.
 
 Options:
   --csv <csvfile>           File to write citation data to.
   -f, --format <format>     XML format; one of: grobid,parscit [default: grobid].
+  -s, --sample FRACTION     Only parse a random sample of this fraction of
+                            files, stratified by venue and year.  The number
+                            of files per stratum is written to
+                            <csvfile>.strata.tsv (see sample_ages.py).
+  --seed NUM                Seed for drawing the sample.
+  -j, --jobs NUM            Number of directories/archives to process in
+                            parallel. [default: 1]
   --log <logfile>           Write log output to this file.
   --debug                   Verbose log messages.
   -h, --help                Display this helpful text.
 """
 
 from docopt import docopt
-import better_exceptions
 import csv
+from collections import defaultdict
 from glob import glob
 import logging
 import logzero
 from logzero import logger as log
-from lxml import etree
 import os
+import tarfile
+import zipfile
 
 
 SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
 
 
-def parse_tei_file(filename):
+def parse_tei_file(filename, name=None):
+    from lxml import etree
+
     tree = etree.parse(filename)
-    base = os.path.basename(filename)
+    base = os.path.basename(name or filename)
     citation_years = []
     bibitem_total = 0
     diff = 0
@@ -64,14 +76,16 @@ def parse_tei_file(filename):
     return citation_years, diff
 
 
-def parse_parscit(filename):
+def parse_parscit(filename, name=None):
+    from lxml import etree
+
     try:
         tree = etree.parse(filename)
     except Exception as e:
         log.exception(e)
         return [], 0
 
-    base = os.path.basename(filename)
+    base = os.path.basename(name or filename)
     citation_years = []
     bibitem_total = 0
     diff = 0
@@ -106,6 +120,85 @@ def parse_parscit(filename):
     return citation_years, diff
 
 
+def is_archive(path):
+    return os.path.isfile(path) and (
+        zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+    )
+
+
+def list_xml_files(path):
+    """
+    Returns the names of all XML files in a directory or archive.
+    """
+    if os.path.isdir(path):
+        return glob(f"{path}/*.xml")
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return [name for name in archive.namelist() if name.endswith(".xml")]
+    with tarfile.open(path, "r:*") as archive:
+        return [
+            member.name
+            for member in archive
+            if member.isfile() and member.name.endswith(".xml")
+        ]
+
+
+def iter_xml_files(path):
+    """
+    Yields (name, source) for all XML files in a directory or archive, where
+    source can be passed to the parsing functions.  For archives, source is a
+    file object that is only valid until the next item is requested.
+    """
+    if os.path.isdir(path):
+        for filename in glob(f"{path}/*.xml"):
+            yield filename, filename
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(".xml"):
+                    with archive.open(info) as f:
+                        yield info.filename, f
+    else:
+        # streaming mode, so that members are decompressed only once, in order
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(".xml"):
+                    yield member.name, archive.extractfile(member)
+
+
+def parse_path(path, parse_file, selected=None):
+    """
+    Parses all XML files in a directory or archive.  Returns (cited_years,
+    stats), where stats maps the name of each directory to the number of
+    entries without a date, the number of files with such entries, and the
+    total number of files.
+    """
+    cited_years = {}
+    stats = defaultdict(lambda: [0, 0, 0])
+    for name, source in iter_xml_files(path):
+        file_id = file_id_of(name)
+        if selected is not None and file_id not in selected:
+            continue
+        log.debug(f"Parsing {os.path.basename(name)}")
+        cited_years[file_id], diff = parse_file(source, name)
+        if os.path.isdir(path):
+            dirname = os.path.basename(path)
+        else:
+            dirname = os.path.basename(os.path.dirname(name))
+        stats[dirname][2] += 1
+        if diff > 0:
+            stats[dirname][0] += diff
+            stats[dirname][1] += 1
+    return cited_years, dict(stats)
+
+
+def file_id_of(filename):
+    file_id = os.path.basename(filename).split(".")[0]
+    if file_id.endswith("-parscit"):
+        file_id = file_id[:-8]
+    return file_id
+
+
 def infer_publication_year(file_id):
     yearstr = file_id[1:3]
     if int(yearstr) < 50:
@@ -114,8 +207,10 @@ def infer_publication_year(file_id):
         return f"19{yearstr}"
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
@@ -136,29 +231,52 @@ if __name__ == "__main__":
         log.critical(f"Unknown --format: {args['--format']}")
         exit(1)
 
-    cited_years = {}
+    selected = None
+    if args["--sample"]:
+        from sample_ages import stratified_sample, strata_filename, write_strata
+
+        file_ids = [
+            file_id_of(filename)
+            for dirname in args["<dir>"]
+            if os.path.exists(dirname)
+            for filename in list_xml_files(dirname)
+        ]
+        selected, strata = stratified_sample(
+            file_ids,
+            float(args["--sample"]),
+            seed=int(args["--seed"]) if args["--seed"] else None,
+        )
+        write_strata(strata_filename(args["--csv"]), strata)
+        log.info(f"Sampled {len(selected)} of {len(file_ids)} files.")
+
+    paths = []
     for dirname in args["<dir>"]:
-        if not os.path.exists(dirname):
+        if not os.path.isdir(dirname) and not is_archive(dirname):
             log.error(f"Directory not found: {dirname}")
             continue
-        dir_diff, dir_files, total_files = 0, 0, 0
-        for filename in glob(f"{dirname}/*.xml"):
-            base = os.path.basename(filename)
-            file_id = base.split(".")[0]
-            if file_id.endswith("-parscit"):
-                file_id = file_id[:-8]
-            log.debug(f"Parsing {base}")
-            cited_years[file_id], diff = parse_file(filename)
-            total_files += 1
-            if diff > 0:
-                dir_diff += diff
-                dir_files += 1
-        if dir_diff > 0:
-            s_entries = "entries" if dir_diff > 1 else "entry"
-            s_dirname = os.path.basename(dirname)
-            log.warning(
-                f"{s_dirname}: Could not parse dates for {dir_diff} {s_entries} in {dir_files}/{total_files} files"
+        paths.append(dirname)
+
+    jobs = min(int(args["--jobs"]), len(paths))
+    if jobs > 1:
+        from functools import partial
+        from multiprocessing import Pool
+
+        with Pool(jobs) as pool:
+            results = pool.map(
+                partial(parse_path, parse_file=parse_file, selected=selected), paths
             )
+    else:
+        results = [parse_path(path, parse_file, selected) for path in paths]
+
+    cited_years = {}
+    for path_years, stats in results:
+        cited_years.update(path_years)
+        for s_dirname, (dir_diff, dir_files, total_files) in stats.items():
+            if dir_diff > 0:
+                s_entries = "entries" if dir_diff > 1 else "entry"
+                log.warning(
+                    f"{s_dirname}: Could not parse dates for {dir_diff} {s_entries} in {dir_files}/{total_files} files"
+                )
 
     cited_count = sum(len(l) for l in cited_years.values())
     log.info(f"Found {cited_count} references with year.")
@@ -170,3 +288,7 @@ if __name__ == "__main__":
         for file_id, years in cited_years.items():
             pub_year = infer_publication_year(file_id)
             writer.writerow([file_id, pub_year, ",".join(years)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""
+Query the citation dataset, either directly or via a local HTTP server.
+
+The data files are loaded and indexed once; lookups then only touch the
+relevant index entries.
+
+Usage:
+  query_citations.py -h
+  query_citations.py serve [options]
+  query_citations.py title <title> [options]
+  query_citations.py paper <paper_id> [options]
+  query_citations.py age <year> [options]
+
+Arguments:
+  <title>                   (Part of a) title of a cited paper.
+  <paper_id>                ACL Anthology ID of a citing paper.
+  <year>                    Publication year of citing papers.
+
+Options:
+  -d, --data DIR            Directory with acl-parscit.tsv and
+                            citations-*.matched.tsv files. [default: {SCRIPTDIR}/../data]
+  -a, --min-age NUM         Minimum age of citations for 'age'. [default: 15]
+  -l, --limit NUM           Maximum number of results for 'title'. [default: 20]
+  --host HOST               Host to bind the server to. [default: 127.0.0.1]
+  --port PORT               Port to bind the server to. [default: 8000]
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+
+Server endpoints:
+  /title?q=<title>[&limit=N]
+  /paper/<paper_id>
+  /age?year=<year>[&min_age=N]
+"""
+
+from collections import defaultdict, Counter
+from docopt import docopt
+import csv
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import logzero
+from logzero import logger as log
+import os
+from urllib.parse import urlparse, parse_qs
+
+from acl_anthology import year_of
+from match_cited_papers import clean_title, read_matched
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def trigrams(title):
+    title = f"  {title} "
+    return {title[i : i + 3] for i in range(len(title) - 2)}
+
+
+class CitationIndex:
+    """
+    In-memory indexes over the matched citation files and the per-paper
+    citation years from acl-parscit.tsv.
+    """
+
+    def __init__(self):
+        self.entries = []  # matched rows as dicts
+        self.by_citing_paper = defaultdict(list)  # paper ID -> entry indices
+        # citing year -> cited year -> (entry index, citing papers from that year)
+        self.by_citing_year = defaultdict(lambda: defaultdict(list))
+        self.by_trigram = defaultdict(list)  # title trigram -> entry indices
+        self.trigram_count = []  # entry index -> no. of trigrams in title
+        self.years_by_paper = {}  # paper ID -> list of cited years
+        self.papers_by_year = defaultdict(list)  # publication year -> paper IDs
+
+    def add_matched(self, filename):
+        for cluster_id, num_cited, year, authors, title, citing in read_matched(
+            filename
+        ):
+            idx = len(self.entries)
+            citing = citing.split(",")
+            self.entries.append(
+                {
+                    "id": cluster_id,
+                    "num_cited": int(num_cited),
+                    "year": year,
+                    "authors": authors,
+                    "title": title,
+                    "citing_papers": citing,
+                }
+            )
+            citing_by_year = defaultdict(list)
+            # a paper may cite the same cluster more than once
+            for paper_id in dict.fromkeys(citing):
+                self.by_citing_paper[paper_id].append(idx)
+                try:
+                    citing_by_year[int(year_of(paper_id))].append(paper_id)
+                except ValueError:
+                    log.debug(f"{paper_id}: Could not infer publication year")
+            # clusters joined across years (e.g. "2003/2004") are indexed
+            # once, under their oldest year
+            cited_years = [int(y) for y in year.split("/") if y.isdigit()]
+            if cited_years:
+                for citing_year, papers in citing_by_year.items():
+                    self.by_citing_year[citing_year][min(cited_years)].append(
+                        (idx, papers)
+                    )
+            title_trigrams = trigrams(clean_title(title))
+            for trigram in title_trigrams:
+                self.by_trigram[trigram].append(idx)
+            self.trigram_count.append(len(title_trigrams))
+
+    def add_parscit(self, filename):
+        with open(filename, "r", newline="") as csvfile:
+            reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+            for row in reader:
+                paper_id, year = row[0], int(row[1])
+                cited = [int(y) for y in row[2].split(",") if y] if len(row) > 2 else []
+                self.years_by_paper[paper_id] = cited
+                self.papers_by_year[year].append(paper_id)
+
+    def find_title(self, title, limit=20, min_overlap=0.8):
+        """
+        Returns matched entries whose titles contain most of the character
+        trigrams of the given title, ranked by their Jaccard similarity.
+        """
+        query = trigrams(clean_title(title))
+        shared = Counter()
+        for trigram in query:
+            shared.update(self.by_trigram.get(trigram, ()))
+        results = []
+        for idx, count in shared.items():
+            if count < min_overlap * len(query):
+                continue
+            score = count / (len(query) + self.trigram_count[idx] - count)
+            results.append((score, idx))
+        results.sort(key=lambda x: (-x[0], -self.entries[x[1]]["num_cited"]))
+        return [dict(self.entries[idx], score=score) for score, idx in results[:limit]]
+
+    def cited_by(self, paper_id):
+        """
+        Returns the matched entries cited by the given paper, as well as the
+        years of all its citations.
+        """
+        return {
+            "paper_id": paper_id,
+            "cited_years": self.years_by_paper.get(paper_id),
+            "cited": [
+                self.entries[idx] for idx in self.by_citing_paper.get(paper_id, ())
+            ],
+        }
+
+    def citations_of_age(self, year, min_age=15):
+        """
+        Returns, for all papers published in the given year, the number of
+        citations that are at least min_age years old, as well as the matched
+        entries of that age which are cited by papers from that year.
+        """
+        max_cited_year = year - min_age
+        papers = {}
+        for paper_id in self.papers_by_year.get(year, ()):
+            cited = self.years_by_paper[paper_id]
+            papers[paper_id] = sum(1 for y in cited if y <= max_cited_year)
+
+        cited = []
+        by_cited_year = self.by_citing_year.get(year, {})
+        for cited_year in sorted(by_cited_year):
+            if cited_year > max_cited_year:
+                break
+            for idx, citing in by_cited_year[cited_year]:
+                cited.append(dict(self.entries[idx], citing_papers=citing))
+        return {"year": year, "min_age": min_age, "papers": papers, "cited": cited}
+
+
+def load_index(datadir):
+    index = CitationIndex()
+    for filename in sorted(glob(f"{datadir}/citations-*.matched.tsv")):
+        log.info(f"Loading {filename}")
+        index.add_matched(filename)
+    parscit = f"{datadir}/acl-parscit.tsv"
+    if os.path.exists(parscit):
+        log.info(f"Loading {parscit}")
+        index.add_parscit(parscit)
+    else:
+        log.warning(f"Couldn't find {parscit}; citation years won't be available")
+    log.info(
+        f"Indexed {len(index.entries)} matched papers and "
+        f"{len(index.years_by_paper)} citing papers."
+    )
+    return index
+
+
+def make_handler(index):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == "/title" and "q" in params:
+                    result = index.find_title(
+                        params["q"], limit=int(params.get("limit", 20))
+                    )
+                elif url.path.startswith("/paper/"):
+                    result = index.cited_by(url.path[len("/paper/") :])
+                elif url.path == "/age" and "year" in params:
+                    result = index.citations_of_age(
+                        int(params["year"]), min_age=int(params.get("min_age", 15))
+                    )
+                else:
+                    self.send_error(404, "Unknown query")
+                    return
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            body = json.dumps(result).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(f"{self.address_string()} {format % args}")
+
+    return QueryHandler
+
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    datadir = args["--data"]
+    if "{SCRIPTDIR}" in datadir:
+        datadir = datadir.replace("{SCRIPTDIR}", SCRIPTDIR)
+    index = load_index(datadir)
+
+    if args["serve"]:
+        server = ThreadingHTTPServer(
+            (args["--host"], int(args["--port"])), make_handler(index)
+        )
+        log.info(f"Serving on http://{args['--host']}:{args['--port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        return
+
+    if args["title"]:
+        result = index.find_title(args["<title>"], limit=int(args["--limit"]))
+    elif args["paper"]:
+        result = index.cited_by(args["<paper_id>"])
+    elif args["age"]:
+        result = index.citations_of_age(
+            int(args["<year>"]), min_age=int(args["--min-age"])
+        )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
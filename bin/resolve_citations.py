@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+"""
+Resolve papers matched by match_cited_papers.py to ACL Anthology IDs and build
+a sparse citation graph.
+
+Usage:
+  resolve_citations.py -h
+  resolve_citations.py <csvfile> --npz <npzfile> [options]
+
+Arguments:
+  <csvfile>                 File produced by match_cited_papers.py.
+
+Options:
+  --npz <npzfile>           File to save the sparse citation matrix to.  The
+                            list of Anthology IDs corresponding to its
+                            rows/columns is saved next to it (*.ids.txt).
+  --resolved <tsvfile>      Write the resolved (cluster ID, Anthology ID)
+                            pairs to this file.
+  -y, --year-slack NUM      Maximum allowed difference between the year of a
+                            cited paper and its Anthology entry. [default: 1]
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import defaultdict
+from docopt import docopt
+import csv
+from glob import glob
+import logging
+import logzero
+from logzero import logger as log
+import numpy as np
+import os
+from scipy import sparse
+from slugify import slugify
+
+from acl_anthology import update_acl_repo, iter_paper_metadata, venue_of
+from match_cited_papers import clean_title, parse_author_string, read_matched
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def read_title_entries(xmlfile):
+    """
+    Returns a list of (full_id, year, first author's last name, cleaned title)
+    for all papers in an Anthology XML file.
+    """
+    entries = []
+    for full_id, year, authors, title in iter_paper_metadata(xmlfile):
+        year = int(year) if year and year.isdigit() else None
+        last = slugify(authors[0][1]) if authors else None
+        entries.append((full_id, year, last, clean_title(title)))
+    return entries
+
+
+def read_title_cache(filename):
+    """
+    Reads the entries of all Anthology XML files saved by write_title_cache().
+    Returns (commit the entries were built from, dict mapping XML filenames to
+    lists of entries).
+    """
+    by_file = defaultdict(list)
+    if not os.path.exists(filename):
+        return None, by_file
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+        _, commit = next(reader)
+        for xmlfile, full_id, year, last, title in reader:
+            by_file[xmlfile].append(
+                (full_id, int(year) if year else None, last or None, title)
+            )
+    return commit, by_file
+
+
+def write_title_cache(filename, commit, by_file):
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        writer.writerow(["commit", commit])
+        for xmlfile in sorted(by_file):
+            for full_id, year, last, title in by_file[xmlfile]:
+                writer.writerow([xmlfile, full_id, year or "", last or "", title])
+
+
+def update_title_entries(by_file, xmlfiles, changed):
+    """
+    Re-reads the XML files that changed or aren't in by_file yet, and drops
+    entries of files that no longer exist.
+    """
+    names = {os.path.basename(xmlfile): xmlfile for xmlfile in xmlfiles}
+    changed = {os.path.basename(xmlfile) for xmlfile in changed}
+    for name in set(by_file) - set(names):
+        del by_file[name]
+    read = 0
+    for name, xmlfile in sorted(names.items()):
+        if name in changed or name not in by_file:
+            log.debug(f"Indexing file: {xmlfile}")
+            by_file[name] = read_title_entries(xmlfile)
+            read += 1
+    log.info(f"Read {read}/{len(names)} Anthology XML files.")
+    return by_file
+
+
+def build_title_index(by_file):
+    """
+    Builds a mapping from cleaned titles to a list of (full_id, year,
+    first author's last name) for all papers, given the entries of all
+    Anthology XML files.
+    """
+    index = defaultdict(list)
+    all_ids = []
+    for xmlfile in sorted(by_file):
+        for full_id, year, last, title in by_file[xmlfile]:
+            all_ids.append(full_id)
+            index[title].append((full_id, year, last))
+    log.info(f"Indexed {len(all_ids)} Anthology papers.")
+    return index, all_ids
+
+
+def resolve_entry(index, year, author_string, title, year_slack=1):
+    """
+    Returns the Anthology ID of a cited paper, or None if it can't be resolved.
+
+    `year` can contain several years separated by '/', as produced by
+    match_cited_papers.py with --join-across-years.
+    """
+    candidates = index.get(clean_title(title))
+    if not candidates:
+        return None
+    years = [int(y) for y in str(year).split("/") if y.isdigit()]
+    authors = parse_author_string(author_string) if author_string else []
+    last = authors[0][1] if authors else None
+    for full_id, c_year, c_last in candidates:
+        if c_year is not None and years:
+            if min(abs(c_year - y) for y in years) > year_slack:
+                continue
+        if last and c_last and last != c_last:
+            continue
+        return full_id
+    return None
+
+
+def build_citation_matrix(edges, node_ids):
+    """
+    Builds a CSR matrix with one row/column per entry in node_ids, where cell
+    (i, j) counts how often paper i cites paper j.
+    """
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+    rows = np.fromiter(
+        (position[a] for a, _ in edges), dtype=np.int32, count=len(edges)
+    )
+    cols = np.fromiter(
+        (position[b] for _, b in edges), dtype=np.int32, count=len(edges)
+    )
+    data = np.ones(len(edges), dtype=np.int32)
+    n = len(node_ids)
+    # duplicate entries are summed up when converting to CSR
+    return sparse.coo_matrix((data, (rows, cols)), shape=(n, n)).tocsr()
+
+
+def save_citation_graph(npzfile, matrix, node_ids):
+    sparse.save_npz(npzfile, matrix)
+    with open(ids_filename(npzfile), "w") as f:
+        for node_id in node_ids:
+            print(node_id, file=f)
+
+
+def load_citation_graph(npzfile):
+    matrix = sparse.load_npz(npzfile).tocsr()
+    with open(ids_filename(npzfile), "r") as f:
+        node_ids = [line.strip() for line in f]
+    return matrix, node_ids
+
+
+def ids_filename(npzfile):
+    if npzfile.endswith(".npz"):
+        npzfile = npzfile[:-4]
+    return f"{npzfile}.ids.txt"
+
+
+def in_citation_counts(matrix):
+    return np.asarray(matrix.sum(axis=0)).ravel()
+
+
+def venue_flows(matrix, node_ids):
+    """
+    Returns (venues, flows), where flows[i, j] is the number of citations from
+    papers in venues[i] to papers in venues[j].
+    """
+    node_venues = [venue_of(node_id) for node_id in node_ids]
+    venues = sorted(set(node_venues))
+    position = {venue: i for i, venue in enumerate(venues)}
+    indicator = sparse.csr_matrix(
+        (
+            np.ones(len(node_ids), dtype=np.int32),
+            ([position[v] for v in node_venues], np.arange(len(node_ids))),
+        ),
+        shape=(len(venues), len(node_ids)),
+    )
+    return venues, (indicator @ matrix @ indicator.T).toarray()
+
+
+def pagerank(matrix, damping=0.85, tol=1e-10, max_iter=100):
+    n = matrix.shape[0]
+    out_degree = np.asarray(matrix.sum(axis=1)).ravel().astype(float)
+    dangling = out_degree == 0
+    inv_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    transition = (sparse.diags(inv_degree) @ matrix).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        new_rank = damping * (transition @ rank + rank[dangling].sum() / n)
+        new_rank += (1.0 - damping) / n
+        if np.abs(new_rank - rank).sum() < tol:
+            return new_rank
+        rank = new_rank
+    log.warning(f"PageRank did not converge after {max_iter} iterations")
+    return rank
+
+
+def main(argv=None):
+    import better_exceptions
+    from git import Repo
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    # titles are cached, so only changed XML files need to be read again
+    repo_dir = f"{SCRIPTDIR}/.anthology-repo"
+    cache_file = f"{repo_dir}.titles.tsv"
+    commit, by_file = read_title_cache(cache_file)
+    changed = update_acl_repo(repo_dir, since=commit)
+    xmlfiles = sorted(glob(f"{repo_dir}/data/xml/*.xml"))
+    update_title_entries(by_file, xmlfiles, changed)
+    write_title_cache(cache_file, Repo(repo_dir).head.commit.hexsha, by_file)
+    index, all_ids = build_title_index(by_file)
+    year_slack = int(args["--year-slack"])
+
+    resolved, edges = [], []
+    data = read_matched(args["<csvfile>"])
+    for cluster_id, _, year, authors, title, citing_papers in data:
+        anthology_id = resolve_entry(index, year, authors, title, year_slack)
+        if anthology_id is None:
+            continue
+        resolved.append((cluster_id, anthology_id))
+        edges.extend((citing, anthology_id) for citing in citing_papers.split(","))
+    log.info(f"Resolved {len(resolved)}/{len(data)} matched papers.")
+
+    known_ids = set(all_ids)
+    node_ids = all_ids + sorted(set(a for a, _ in edges) - known_ids)
+    matrix = build_citation_matrix(edges, node_ids)
+    save_citation_graph(args["--npz"], matrix, node_ids)
+    log.info(f"Saved citation graph with {matrix.nnz} edges to {args['--npz']}")
+
+    if args["--resolved"]:
+        with open(args["--resolved"], "w", newline="") as csvfile:
+            writer = csv.writer(
+                csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+            )
+            for row in resolved:
+                writer.writerow(row)
+
+    counts = in_citation_counts(matrix)
+    for i in np.argsort(-counts)[:10]:
+        if counts[i] == 0:
+            break
+        log.info(f"Most cited: {node_ids[i]} ({counts[i]} citations)")
+
+
+if __name__ == "__main__":
+    main()
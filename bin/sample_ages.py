@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+Estimate citation age statistics per year from a stratified sample of papers.
+
+Papers are stratified by venue and year (as encoded in their Anthology IDs).
+The input can either be a full file produced by parse_tei.py, from which a
+sample is drawn with --sample, or a file that was already produced from a
+sample with `parse_tei.py --sample`, in which case the number of papers per
+stratum is read from the accompanying *.strata.tsv file.
+
+Usage:
+  sample_ages.py -h
+  sample_ages.py <csvfile> --csv <outfile> [options]
+
+Arguments:
+  <csvfile>                 File produced by parse_tei.py (e.g. acl-parscit.tsv).
+
+Options:
+  --csv <outfile>           File to write the estimates to.
+  -s, --sample FRACTION     Only use a stratified sample of this fraction of
+                            papers from <csvfile>.
+  --strata <file>           File with the number of papers per stratum.
+                            [default: {csvfile}.strata.tsv]
+  --seed NUM                Seed for drawing the sample.
+  -c, --confidence NUM      Confidence level in percent. [default: 95]
+  -o, --older-than NUM      Also estimate the percentage of citations that are
+                            older than this many years. [default: 10]
+  --max-age NUM             Ignore citations older than this. [default: 50]
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import defaultdict
+from docopt import docopt
+import csv
+import logging
+import logzero
+from logzero import logger as log
+import os
+import random
+
+from acl_anthology import venue_of, year_of
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def stratum_of(file_id):
+    """
+    Returns the (venue, year) of an Anthology ID, e.g. ('ACL', '2018') for
+    P18-1001 or ('ACL', '2020') for 2020.acl-main.699.
+    """
+    return venue_of(file_id), year_of(file_id)
+
+
+def stratified_sample(file_ids, fraction, seed=None):
+    """
+    Draws a random sample of the given fraction from every stratum, but at
+    least two IDs (so that variances can be estimated), or all IDs if there are
+    fewer.  Returns (set of sampled IDs, dict of stratum -> (population size,
+    sample size)).
+    """
+    rng = random.Random(seed)
+    by_stratum = defaultdict(list)
+    for file_id in file_ids:
+        by_stratum[stratum_of(file_id)].append(file_id)
+    sampled, strata = set(), {}
+    for stratum in sorted(by_stratum):
+        ids = sorted(by_stratum[stratum])
+        size = min(len(ids), max(2, round(fraction * len(ids))))
+        sampled.update(rng.sample(ids, size))
+        strata[stratum] = (len(ids), size)
+    return sampled, strata
+
+
+def strata_filename(csvfile):
+    return f"{csvfile}.strata.tsv"
+
+
+def write_strata(filename, strata):
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        for (venue, year), (population, size) in sorted(strata.items()):
+            writer.writerow([venue, year, population, size])
+
+
+def read_strata(filename):
+    strata = {}
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+        for venue, year, population, size in reader:
+            strata[(venue, year)] = (int(population), int(size))
+    return strata
+
+
+def ratio_estimate(samples, populations, numerator, denominator):
+    """
+    Combined ratio estimator over strata, sum(numerator) / sum(denominator),
+    with its standard error from Taylor linearization.
+
+    samples maps each stratum to a dict of per-paper value arrays;
+    populations maps each stratum to its number of papers.
+    """
+    import numpy as np
+
+    total_num = sum(populations[h] * s[numerator].mean() for h, s in samples.items())
+    total_den = sum(populations[h] * s[denominator].mean() for h, s in samples.items())
+    if total_den == 0:
+        return float("nan"), float("nan")
+    ratio = total_num / total_den
+
+    variance = 0.0
+    for h, s in samples.items():
+        n, N = len(s[numerator]), populations[h]
+        if n < 2 or n >= N:
+            continue
+        residuals = s[numerator] - ratio * s[denominator]
+        variance += N**2 * (1 - n / N) * residuals.var(ddof=1) / n
+    return ratio, np.sqrt(variance) / total_den
+
+
+def read_paper_values(filename, max_age=50, older_than=10, sample=None):
+    """
+    Reads a file produced by parse_tei.py and returns a dict mapping each
+    stratum to a dict of per-paper value arrays.  If `sample` is given, only
+    papers in this set are considered.
+    """
+    import numpy as np
+
+    values = defaultdict(lambda: defaultdict(list))
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+        for row in reader:
+            paper_id, year = row[0], int(row[1])
+            if sample is not None and paper_id not in sample:
+                continue
+            citations = row[2].split(",") if len(row) > 2 else []
+            paper = values[stratum_of(paper_id)]
+            if len(citations) <= 1:
+                # Front matter or articles that otherwise failed to parse any
+                # citations; these count as sampled, but don't contribute
+                ages = np.zeros(0, dtype=int)
+                paper["papers"].append(0)
+            else:
+                ages = year - np.array(citations, dtype=int)
+                ages = ages[(ages >= 0) & (ages <= max_age)]
+                paper["papers"].append(1)
+            paper["citations"].append(len(ages))
+            paper["age_sum"].append(ages.sum())
+            paper["older"].append((ages > older_than).sum())
+    return {
+        stratum: {name: np.array(v, dtype=float) for name, v in paper.items()}
+        for stratum, paper in values.items()
+    }
+
+
+def main(argv=None):
+    import better_exceptions
+    from statistics import NormalDist
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    older_than = int(args["--older-than"])
+    seed = int(args["--seed"]) if args["--seed"] else None
+    z = NormalDist().inv_cdf(0.5 + float(args["--confidence"]) / 200)
+
+    sample, strata = None, {}
+    if args["--sample"]:
+        with open(args["<csvfile>"], "r", newline="") as csvfile:
+            ids = [line.split("\t", 1)[0] for line in csvfile]
+        sample, strata = stratified_sample(ids, float(args["--sample"]), seed)
+        log.info(f"Sampled {len(sample)} of {len(ids)} papers.")
+    else:
+        strata_file = args["--strata"].replace("{csvfile}", args["<csvfile>"])
+        if os.path.exists(strata_file):
+            strata = read_strata(strata_file)
+        else:
+            log.warning(
+                f"Couldn't find {strata_file}; treating input as the full population"
+            )
+
+    samples = read_paper_values(
+        args["<csvfile>"],
+        max_age=int(args["--max-age"]),
+        older_than=older_than,
+        sample=sample,
+    )
+
+    by_year = defaultdict(dict)
+    for (venue, year), values in samples.items():
+        by_year[year][(venue, year)] = values
+    estimates = [
+        ("mean_age", "age_sum", "citations", 1),
+        (f"pct_older_than_{older_than}", "older", "citations", 100),
+        ("citations_per_paper", "citations", "papers", 1),
+    ]
+
+    with open(args["--csv"], "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        writer.writerow(
+            ["year", "sampled", "papers", "statistic", "estimate", "stderr"]
+            + ["lower", "upper"]
+        )
+        for year in sorted(by_year):
+            year_samples = by_year[year]
+            sizes = {h: len(s["papers"]) for h, s in year_samples.items()}
+            populations = {h: strata.get(h, (sizes[h],))[0] for h in year_samples}
+            for name, numerator, denominator, scale in estimates:
+                estimate, stderr = ratio_estimate(
+                    year_samples, populations, numerator, denominator
+                )
+                estimate, stderr = scale * estimate, scale * stderr
+                writer.writerow(
+                    [year, sum(sizes.values()), sum(populations.values()), name]
+                    + [
+                        f"{x:.4f}"
+                        for x in (
+                            estimate,
+                            stderr,
+                            estimate - z * stderr,
+                            estimate + z * stderr,
+                        )
+                    ]
+                )
+
+
+if __name__ == "__main__":
+    main()
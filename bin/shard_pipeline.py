@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+"""
+Run the ParsCit pipeline (see run_parscit_pipeline.sh) in shards, e.g. on
+several machines, and merge the results.
+
+`plan` splits the PDF files matching the given ID prefixes into contiguous
+ranges of Anthology IDs with roughly the same total file size.  `run` processes
+a single shard on one machine; everything it produces (text files, ParsCit XML
+files, logs, and the output of parse_tei.py) is written to its own shard
+directory.  Once all shards are done, `merge` combines the shard outputs and
+logs into the files expected by summarize_logs.py.
+
+Usage:
+  shard_pipeline.py -h
+  shard_pipeline.py plan <planfile> <pdfdir> [<prefix>...] --shards NUM [options]
+  shard_pipeline.py run <planfile> <shard> <pdfdir> <outdir> [options]
+  shard_pipeline.py merge <planfile> <outdir> [options]
+
+Arguments:
+  <planfile>                File to write/read the shard plan to/from.
+  <pdfdir>                  Directory with PDF files, searched recursively
+                            (e.g. $STORAGEDIR/anthology-pdf).
+  <prefix>                  ID prefixes of files to process; defaults to those
+                            in run_parscit_pipeline.sh.
+  <shard>                   Number of the shard to process, starting at 0.
+  <outdir>                  Directory with one subdirectory per shard.
+
+Options:
+  -n, --shards NUM          Number of shards to create; shards are split by
+                            total file size, as an estimate of the work.
+  --parscit <script>        Path to ParsCit's citeExtract.pl.
+                            [default: citeExtract.pl]
+  --pdftotext <cmd>         Command to convert PDF files to text.
+                            [default: pdftotext]
+  --csv <csvfile>           File to write the merged citation data to.
+                            [default: {SCRIPTDIR}/../data/acl-parscit.csv]
+  --logdir DIR              Directory to write the merged logs to.
+                            [default: {SCRIPTDIR}]
+  --debug                   Verbose log messages.
+  -h, --help                Display this helpful text.
+"""
+
+from collections import Counter, OrderedDict
+from docopt import docopt
+from glob import glob
+import csv
+import logging
+import logzero
+from logzero import logger as log
+import os
+import re
+import subprocess
+import sys
+
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+
+# same as in run_parscit_pipeline.sh
+PREFIXES = "D10 D11 D12 D13 D14 D15 D16 D17 D18 D19-1 E1 J1 N1 P1 Q1".split()
+
+LOGFILES = {
+    "pdftotext": "run_parscit_pipeline.pdftotext.log",
+    "parscit": "run_parscit_pipeline.parscit.log",
+    "tei": "run_parscit_pipeline.tei.log",
+}
+OUTFILE = "acl-parscit.csv"
+DONEFILE = "DONE"
+
+RE_TEI_DIR_STATS = re.compile(
+    r"^(.*\] )([^ ]+): Could not parse dates for ([0-9]+) entr(?:y|ies) in ([0-9]+)/([0-9]+) files$"
+)
+RE_TEI_FOUND = re.compile(r"^(.*\] )Found ([0-9]+) references with year\.$")
+
+
+def find_pdfs(pdfdir, prefixes=PREFIXES):
+    """
+    Returns a dict mapping the Anthology IDs of all PDF files in pdfdir that
+    start with one of the prefixes to their filenames, sorted by ID.
+    """
+    pdfs = {}
+    for filename in glob(f"{pdfdir}/**/*.pdf", recursive=True):
+        file_id = os.path.basename(filename)[:-4]
+        if file_id.startswith(tuple(prefixes)):
+            pdfs[file_id] = filename
+    return OrderedDict(sorted(pdfs.items()))
+
+
+def plan_shards(sizes, num_shards):
+    """
+    Splits a list of (file_id, size), sorted by ID, into at most num_shards
+    contiguous ranges with roughly equal total size.  Returns a list of
+    (first_id, last_id, number of files, total size).
+    """
+    total = sum(size for _, size in sizes)
+    shards = []
+    start, cumulative = 0, 0
+    for i, (_, size) in enumerate(sizes):
+        cumulative += size
+        # close the shard once it reaches its share of the total size, but
+        # leave at least one file for each of the remaining shards
+        remaining_shards = num_shards - len(shards) - 1
+        if i + 1 == len(sizes) or (
+            remaining_shards > 0
+            and (
+                cumulative >= total * (len(shards) + 1) / num_shards
+                or len(sizes) - i - 1 <= remaining_shards
+            )
+        ):
+            shard = sizes[start : i + 1]
+            shards.append(
+                (shard[0][0], shard[-1][0], len(shard), sum(s for _, s in shard))
+            )
+            start = i + 1
+    return shards
+
+
+def write_plan(filename, shards, prefixes):
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.writer(
+            csvfile, delimiter="\t", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
+        for shard, (first_id, last_id, files, size) in enumerate(shards):
+            writer.writerow([shard, first_id, last_id, files, size, " ".join(prefixes)])
+
+
+def read_plan(filename):
+    """
+    Reads a shard plan; returns a list of (first_id, last_id, number of files,
+    total size, prefixes).
+    """
+    shards = []
+    with open(filename, "r", newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter="\t", quotechar="|")
+        for shard, first_id, last_id, files, size, prefixes in reader:
+            shards.append((first_id, last_id, int(files), int(size), prefixes.split()))
+    return shards
+
+
+def shard_dir(outdir, shard):
+    return f"{outdir}/shard-{shard:03d}"
+
+
+def run_shard(pdfs, workdir, parscit, pdftotext="pdftotext"):
+    """
+    Runs pdftotext and ParsCit on the given PDF files and parse_tei.py on the
+    result, writing all files and logs to workdir, in the same layout as
+    run_parscit_pipeline.sh does.
+    """
+    from tqdm import tqdm
+
+    logs = {
+        name: open(f"{workdir}/{logfile}", "w") for name, logfile in LOGFILES.items()
+    }
+    logs["tei"].close()
+    try:
+        for pdf in tqdm(pdfs, unit="files"):
+            filename = os.path.basename(pdf)
+            prefix = filename[:3]
+            logs["pdftotext"].write(f"{filename}\n")
+            logs["parscit"].write(f"{filename}\n")
+            os.makedirs(f"{workdir}/anthology-txt/{prefix}", exist_ok=True)
+            os.makedirs(f"{workdir}/anthology-parscit/{prefix}", exist_ok=True)
+            txt = f"{workdir}/anthology-txt/{prefix}/{filename[:-4]}.txt"
+            xml = f"{workdir}/anthology-parscit/{prefix}/{filename[:-4]}.xml"
+
+            # flush, as the subprocesses write to the same log files
+            for name in ("pdftotext", "parscit"):
+                logs[name].flush()
+            subprocess.run(
+                [pdftotext, "-raw", pdf, txt],
+                stdout=logs["pdftotext"],
+                stderr=subprocess.STDOUT,
+            )
+            result = subprocess.run(
+                ["perl", "-X", parscit, "-m", "extract_citations", txt, xml],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+            for line in result.stdout.splitlines(keepends=True):
+                if "Ignoring json" not in line:
+                    logs["parscit"].write(line)
+    finally:
+        for f in logs.values():
+            f.close()
+
+    xmldirs = sorted(glob(f"{workdir}/anthology-parscit/*"))
+    if xmldirs:
+        subprocess.run(
+            [sys.executable, f"{SCRIPTDIR}/parse_tei.py"]
+            + xmldirs
+            + ["--csv", f"{workdir}/{OUTFILE}", "-f", "parscit"]
+            + ["--log", f"{workdir}/{LOGFILES['tei']}"],
+            check=True,
+        )
+    else:
+        open(f"{workdir}/{OUTFILE}", "w").close()
+
+
+def merge_tei_logs(logfiles, outfile, dir_totals):
+    """
+    Concatenates parse_tei.py logs, adding up the per-directory statistics and
+    reference counts, since a directory can be split across several shards.
+
+    parse_tei.py only logs statistics for directories with problems, so the
+    total number of files per directory is taken from dir_totals instead.
+    """
+    dir_stats = OrderedDict()
+    found, found_prefix = 0, None
+    with open(outfile, "w") as out:
+        for logfile in logfiles:
+            with open(logfile, "r") as f:
+                for line in f:
+                    m = RE_TEI_DIR_STATS.match(line.rstrip("\n"))
+                    if m:
+                        prefix, dirname, *numbers = m.groups()
+                        stats = dir_stats.setdefault(dirname, [prefix, 0, 0])
+                        stats[1] += int(numbers[0])
+                        stats[2] += int(numbers[1])
+                        continue
+                    m = RE_TEI_FOUND.match(line.rstrip("\n"))
+                    if m:
+                        found_prefix = found_prefix or m.group(1)
+                        found += int(m.group(2))
+                        continue
+                    out.write(line)
+        for dirname, (prefix, diff, files) in dir_stats.items():
+            s_entries = "entries" if diff > 1 else "entry"
+            out.write(
+                f"{prefix}{dirname}: Could not parse dates for {diff} {s_entries} in {files}/{dir_totals[dirname]} files\n"
+            )
+        if found_prefix is not None:
+            out.write(f"{found_prefix}Found {found} references with year.\n")
+
+
+def merge_shards(workdirs, csvfile, logdir):
+    seen = set()
+    with open(csvfile, "w") as out:
+        for workdir in workdirs:
+            with open(f"{workdir}/{OUTFILE}", "r") as f:
+                for line in f:
+                    file_id = line.split("\t", 1)[0]
+                    if file_id in seen:
+                        log.warning(f"{file_id}: found in several shards; skipping")
+                        continue
+                    seen.add(file_id)
+                    out.write(line)
+    log.info(f"Wrote {len(seen)} papers to {csvfile}")
+
+    for name in ("pdftotext", "parscit"):
+        with open(f"{logdir}/{LOGFILES[name]}", "w") as out:
+            for workdir in workdirs:
+                with open(f"{workdir}/{LOGFILES[name]}", "r") as f:
+                    out.write(f.read())
+    dir_totals = Counter()
+    for workdir in workdirs:
+        for xmldir in glob(f"{workdir}/anthology-parscit/*"):
+            dir_totals[os.path.basename(xmldir)] += len(glob(f"{xmldir}/*.xml"))
+    merge_tei_logs(
+        [f"{workdir}/{LOGFILES['tei']}" for workdir in workdirs],
+        f"{logdir}/{LOGFILES['tei']}",
+        dir_totals,
+    )
+    log.info(f"Wrote merged logs to {logdir}")
+
+
+def main(argv=None):
+    import better_exceptions
+
+    args = docopt(__doc__, argv=argv)
+
+    log_level = logging.DEBUG if args["--debug"] else logging.INFO
+    logzero.loglevel(log_level)
+    logzero.formatter(logzero.LogFormatter(datefmt="%Y-%m-%d %H:%M:%S"))
+
+    if args["plan"]:
+        prefixes = args["<prefix>"] or PREFIXES
+        pdfs = find_pdfs(args["<pdfdir>"], prefixes)
+        if not pdfs:
+            log.error(f"No matching PDF files found in {args['<pdfdir>']}")
+            exit(1)
+        sizes = [(file_id, os.path.getsize(pdf)) for file_id, pdf in pdfs.items()]
+        shards = plan_shards(sizes, int(args["--shards"]))
+        write_plan(args["<planfile>"], shards, prefixes)
+        for shard, (first_id, last_id, files, size) in enumerate(shards):
+            log.info(
+                f"Shard {shard}: {first_id}--{last_id}, {files} files, {size/2**20:.1f} MiB"
+            )
+
+    elif args["run"]:
+        shards = read_plan(args["<planfile>"])
+        shard = int(args["<shard>"])
+        first_id, last_id, num_files, _, prefixes = shards[shard]
+        pdfs = [
+            pdf
+            for file_id, pdf in find_pdfs(args["<pdfdir>"], prefixes).items()
+            if first_id <= file_id <= last_id
+        ]
+        if len(pdfs) != num_files:
+            log.warning(
+                f"Shard {shard} was planned with {num_files} files, but found {len(pdfs)}"
+            )
+        workdir = shard_dir(args["<outdir>"], shard)
+        os.makedirs(workdir, exist_ok=True)
+        if os.path.exists(f"{workdir}/{DONEFILE}"):
+            os.remove(f"{workdir}/{DONEFILE}")
+        log.info(f"Processing shard {shard} ({len(pdfs)} files) in {workdir}")
+        run_shard(pdfs, workdir, args["--parscit"], pdftotext=args["--pdftotext"])
+        open(f"{workdir}/{DONEFILE}", "w").close()
+
+    elif args["merge"]:
+        shards = read_plan(args["<planfile>"])
+        workdirs = [shard_dir(args["<outdir>"], i) for i in range(len(shards))]
+        missing = [d for d in workdirs if not os.path.exists(f"{d}/{DONEFILE}")]
+        if missing:
+            log.error(f"Shards not (yet) completed: {', '.join(missing)}")
+            exit(1)
+        merge_shards(
+            workdirs,
+            args["--csv"].replace("{SCRIPTDIR}", SCRIPTDIR),
+            args["--logdir"].replace("{SCRIPTDIR}", SCRIPTDIR),
+        )
+
+
+if __name__ == "__main__":
+    main()
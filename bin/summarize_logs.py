@@ -89,8 +89,8 @@ def gather_parsetei_log(logfile):
     return logs
 
 
-if __name__ == "__main__":
-    args = docopt(__doc__)
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
 
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logzero.loglevel(log_level)
@@ -144,3 +144,7 @@ if __name__ == "__main__":
     while failures:
         log.warning("   " + ", ".join(failures[:8]) + ",")
         failures = failures[8:]
+
+
+if __name__ == "__main__":
+    main()
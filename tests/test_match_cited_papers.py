@@ -0,0 +1,113 @@
+import os
+import random
+import sys
+
+import pytest
+from fuzzywuzzy import fuzz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bin"))
+import match_cited_papers  # noqa: E402
+
+
+def random_pairs(n, seed=0):
+    rng = random.Random(seed)
+    alphabet = "abcde-"
+    for _ in range(n):
+        a = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 30)))
+        if rng.random() < 0.5:
+            b = list(a)
+            for _ in range(rng.randint(0, 3)):
+                op = rng.random()
+                if op < 0.3 and len(b) > 1:
+                    del b[rng.randrange(len(b))]
+                elif op < 0.6:
+                    b.insert(rng.randint(0, len(b)), rng.choice(alphabet))
+                else:
+                    i, j = rng.randrange(len(b)), rng.randrange(len(b))
+                    b[i], b[j] = b[j], b[i]
+            b = "".join(b)
+        else:
+            b = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 30)))
+        if a != b:
+            yield a, b
+
+
+@pytest.fixture
+def set_ratio(monkeypatch):
+    def set_ratio(ratio, count_filters):
+        monkeypatch.setattr(match_cited_papers, "FUZZRATIO", ratio)
+        monkeypatch.setattr(match_cited_papers, "COUNT_FILTERS", count_filters)
+
+    return set_ratio
+
+
+@pytest.mark.parametrize("count_filters", [False, True])
+def test_length_bound_at_rounding_boundaries(set_ratio, count_filters):
+    # the length bound is exact for these strings, so every possible ratio,
+    # including ties at .5, is checked against fuzz.ratio
+    pairs = [
+        ("a" * la, "a" * la + "b" * extra)
+        for la in range(1, 120)
+        for extra in range(1, 120)
+    ]
+    for ratio in range(0, 100):
+        set_ratio(ratio, count_filters)
+        for a, b in pairs:
+            expected = fuzz.ratio(a, b) > ratio
+            assert match_cited_papers.fuzzy_match(a, b) == expected, (ratio, a, b)
+
+
+@pytest.mark.parametrize("count_filters", [False, True])
+def test_fuzzy_match_equals_ratio(set_ratio, count_filters):
+    pairs = list(random_pairs(5000))
+    for ratio in range(0, 100, 3):
+        set_ratio(ratio, count_filters)
+        for a, b in pairs:
+            expected = fuzz.ratio(a, b) > ratio
+            assert match_cited_papers.fuzzy_match(a, b) == expected, (ratio, a, b)
+
+
+def citation_rows(years=("2003", "2004"), seed=0):
+    # rebuild one row per citation from the matched data, with some titles
+    # slightly changed so that clusters are formed by fuzzy matches, too
+    rng = random.Random(seed)
+    filename = os.path.join(
+        os.path.dirname(__file__), "..", "data", "citations-x19-age15plus.matched.tsv"
+    )
+    rows = []
+    for _, _, year, authors, title, citing in match_cited_papers.read_matched(filename):
+        if year not in years:
+            continue
+        for paper_id in citing.split(","):
+            if len(title) > 20 and rng.random() < 0.3:
+                i = rng.randrange(len(title))
+                title = title[:i] + title[i + 1 :]
+            rows.append([paper_id, year, authors, title])
+    return rows
+
+
+def clusters_of(matched):
+    return {
+        year: {n: [row[:4] for row in rows] for n, rows in by_id.items()}
+        for year, by_id in matched.items()
+    }
+
+
+def test_union_find_is_independent_of_order_and_processes():
+    rows = citation_rows()
+    expected = clusters_of(
+        match_cited_papers.match_data([list(row) for row in rows], union_find=True)
+    )
+    # sanity check: some clusters were merged by fuzzy matching
+    assert any(
+        len({tuple(row[2:4]) for row in cluster}) > 1
+        for by_id in expected.values()
+        for cluster in by_id.values()
+    )
+
+    random.Random(1).shuffle(rows)
+    for processes in (1, 2):
+        matched = match_cited_papers.match_data(
+            [list(row) for row in rows], union_find=True, processes=processes
+        )
+        assert clusters_of(matched) == expected
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bin"))
+import query_citations  # noqa: E402
+
+
+def write_matched(filename, rows):
+    with open(filename, "w") as f:
+        f.write("id\tnum_cited\tyear\tauthors\ttitle\tciting_papers\n")
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+
+
+def test_joined_years_are_returned_once(tmp_path):
+    filename = tmp_path / "citations-test.matched.tsv"
+    write_matched(
+        filename,
+        [
+            ("2003-0001", "3", "2003/2004", "A", "Joined title", "D19-1001,D19-1002"),
+            ("2003-0002", "2", "2003", "B", "Cited twice", "D19-1003,D19-1003"),
+            ("2018-0001", "1", "2018", "C", "Recent title", "D19-1001"),
+        ],
+    )
+    index = query_citations.CitationIndex()
+    index.add_matched(str(filename))
+
+    result = index.citations_of_age(2019, min_age=10)
+    assert [e["id"] for e in result["cited"]] == ["2003-0001", "2003-0002"]
+    assert result["cited"][0]["citing_papers"] == ["D19-1001", "D19-1002"]
+    assert result["cited"][1]["citing_papers"] == ["D19-1003"]
+
+    # only one of the joined years is old enough
+    result = index.citations_of_age(2019, min_age=16)
+    assert [e["id"] for e in result["cited"]] == ["2003-0001", "2003-0002"]
+
+    assert [e["id"] for e in index.cited_by("D19-1003")["cited"]] == ["2003-0002"]
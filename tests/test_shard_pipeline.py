@@ -0,0 +1,138 @@
+import os
+import re
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bin"))
+import shard_pipeline  # noqa: E402
+
+# stand-ins for pdftotext and ParsCit: the "PDF" files contain the cited
+# years as text, with "x" for a citation without a date
+PDFTOTEXT = """#!/usr/bin/env python3
+import shutil, sys
+shutil.copy(sys.argv[2], sys.argv[3])
+"""
+PARSCIT = r"""
+my (undef, undef, $in, $out) = @ARGV;
+open(IN, $in); my @tokens = split(' ', join('', <IN>)); close(IN);
+open(OUT, ">$out");
+print OUT "<algorithms><algorithm><citationList>\n";
+for (@tokens) {
+    if ($_ eq 'x') { print OUT "<citation></citation>\n"; }
+    else { print OUT "<citation><date>$_</date></citation>\n"; }
+}
+print OUT "</citationList></algorithm></algorithms>\n";
+close(OUT);
+print "Ignoring json\n";
+print "Extracted citations from $in\n";
+"""
+
+
+def test_plan_shards():
+    sizes = [(f"P18-{i:04d}", size) for i, size in enumerate([5, 1, 1, 1, 4, 2, 6])]
+    shards = shard_pipeline.plan_shards(sizes, 3)
+    assert shards == [
+        ("P18-0000", "P18-0002", 3, 7),
+        ("P18-0003", "P18-0005", 3, 7),
+        ("P18-0006", "P18-0006", 1, 6),
+    ]
+    # never more shards than files, and no empty ones
+    assert len(shard_pipeline.plan_shards(sizes[:2], 3)) == 2
+    assert [s[2] for s in shard_pipeline.plan_shards(sizes[:3], 3)] == [1, 1, 1]
+
+
+def test_merge_tei_logs(tmp_path):
+    logs = []
+    for i, (diff, files) in enumerate([(3, 2), (1, 1)]):
+        logs.append(tmp_path / f"{i}.log")
+        logs[-1].write_text(
+            f"[E 200101 00:00:0{i} parse_tei:70] P18-100{i}.xml: Could not find any bibliography dates\n"
+            f"[W 200101 00:00:0{i} parse_tei:276] P18: Could not parse dates for {diff} entries in {files}/5 files\n"
+            f"[I 200101 00:00:0{i} parse_tei:279] Found {10 + i} references with year.\n"
+        )
+    merged = tmp_path / "merged.log"
+    shard_pipeline.merge_tei_logs(logs, merged, {"P18": 12})
+    assert merged.read_text().splitlines() == [
+        "[E 200101 00:00:00 parse_tei:70] P18-1000.xml: Could not find any bibliography dates",
+        "[E 200101 00:00:01 parse_tei:70] P18-1001.xml: Could not find any bibliography dates",
+        "[W 200101 00:00:00 parse_tei:276] P18: Could not parse dates for 4 entries in 3/12 files",
+        "[I 200101 00:00:00 parse_tei:279] Found 21 references with year.",
+    ]
+
+
+def make_pdfs(pdfdir):
+    for n, prefix in enumerate(("D19-1", "P18-1")):
+        os.makedirs(pdfdir / prefix[:3])
+        for i in range(7):
+            years = " ".join(str(1990 + (n + i + k) % 29) for k in range(i + 2))
+            if i % 3 == 0:
+                years += " x" * (i // 3 + 1)
+            (pdfdir / prefix[:3] / f"{prefix}{i:03d}.pdf").write_text(years)
+    # not matching any of the prefixes
+    (pdfdir / "D19" / "D19-5001.pdf").write_text("2000")
+
+
+def run_pipeline(tmp_path, pdfdir, name, num_shards, stubs):
+    planfile, outdir = tmp_path / f"{name}.plan", tmp_path / name
+    logdir = tmp_path / f"{name}-logs"
+    os.makedirs(logdir)
+    script = shard_pipeline.__file__
+    shard_pipeline.main(
+        ["plan", str(planfile), str(pdfdir), "D19-1", "P18-1", "-n", str(num_shards)]
+    )
+    # the shards run as separate processes, like on separate machines
+    processes = [
+        subprocess.Popen(
+            [sys.executable, script, "run", str(planfile), str(shard)]
+            + [str(pdfdir), str(outdir)]
+            + ["--parscit", stubs["parscit"], "--pdftotext", stubs["pdftotext"]],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for shard in range(num_shards)
+    ]
+    assert [p.wait() for p in processes] == [0] * num_shards
+    shard_pipeline.main(
+        ["merge", str(planfile), str(outdir)]
+        + ["--csv", str(tmp_path / f"{name}.csv"), "--logdir", str(logdir)]
+    )
+    return (tmp_path / f"{name}.csv").read_text(), {
+        logname: (logdir / logfile).read_text()
+        for logname, logfile in shard_pipeline.LOGFILES.items()
+    }
+
+
+def without_shard_dirs(text):
+    return re.sub(r"/(single|sharded)/shard-[0-9]+/", "/", text)
+
+
+def log_messages(text):
+    # without timestamps, which differ between runs
+    return sorted(line.split("] ", 1)[-1] for line in text.splitlines())
+
+
+def test_sharded_run_matches_single_run(tmp_path):
+    pdfdir = tmp_path / "pdf"
+    make_pdfs(pdfdir)
+    stubs = {
+        "pdftotext": str(tmp_path / "pdftotext"),
+        "parscit": str(tmp_path / "ps.pl"),
+    }
+    with open(stubs["pdftotext"], "w") as f:
+        f.write(PDFTOTEXT)
+    os.chmod(stubs["pdftotext"], 0o755)
+    with open(stubs["parscit"], "w") as f:
+        f.write(PARSCIT)
+
+    single_csv, single_logs = run_pipeline(tmp_path, pdfdir, "single", 1, stubs)
+    sharded_csv, sharded_logs = run_pipeline(tmp_path, pdfdir, "sharded", 3, stubs)
+
+    assert len(single_csv.splitlines()) == 14
+    assert sorted(sharded_csv.splitlines()) == sorted(single_csv.splitlines())
+    assert "Ignoring json" not in single_logs["parscit"]
+    for logname in ("pdftotext", "parscit"):
+        assert without_shard_dirs(sharded_logs[logname]) == without_shard_dirs(
+            single_logs[logname]
+        )
+    assert "D19: Could not parse dates for 6 entries in 3/7 files" in single_logs["tei"]
+    assert log_messages(sharded_logs["tei"]) == log_messages(single_logs["tei"])